@@ -0,0 +1,151 @@
+import glob
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from JackTokenizer import JackTokenizer, KEYWORDS, SYMBOLS
+from JackCompiler import compile_file
+from Optimizer import DEFAULT_PASSES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "7, 8"))
+from vmemulator import VMEmulator, FUNCTION
+
+COPIES = 50
+PROGRAMS = [os.path.join(HERE, "..", "12", "MathTest"), os.path.join(HERE, "..", "9", "Pong")]
+STEP_LIMIT = 1000000
+
+def synthesize(copies, output_file):
+    """ Concatenates the Jack sources of projects 9 and 12 `copies` times;
+    returns the number of source files used """
+
+    sources = sorted(glob.glob(os.path.join(HERE, "..", "9", "**", "*.jack"), recursive=True))
+    sources += sorted(glob.glob(os.path.join(HERE, "..", "12", "**", "*.jack"), recursive=True))
+    code = ""
+    for source in sources:
+        with open(source, 'r') as f:
+            code += f.read() + "\n"
+    with open(output_file, 'w') as out:
+        out.write(code * copies)
+    return len(sources)
+
+def tokenize_strings(input_file):
+    """ The tokenizer before typed tokens: findall returns bare strings and
+    each one is classified again when its type is asked for """
+
+    with open(input_file, 'r') as f:
+        code = f.read()
+    code = re.sub(r'/\*\*?.*?\*/', '', code, flags=re.DOTALL)
+    code = re.sub(r'//.*', '', code)
+    tokens = re.findall(
+        r'"[^"\n]*"'
+        r'|[\{\}\(\)\[\]\.\,\;\+\-\*\/\&\|\<\>\=\~]'
+        r'|[A-Za-z_]\w*'
+        r'|\d+', code)
+    kinds = []
+    for token in tokens:
+        if token in KEYWORDS:
+            kinds.append("keyword")
+        elif token in SYMBOLS:
+            kinds.append("symbol")
+        elif token.isdigit():
+            kinds.append("integerConstant")
+        elif token.startswith('"') and token.endswith('"'):
+            kinds.append("stringConstant")
+        else:
+            kinds.append("identifier")
+    return len(tokens)
+
+def tokenize_records(input_file):
+    tokenizer = JackTokenizer(input_file)
+    kinds = [token[0] for token in tokenizer.tokens]
+    return len(kinds)
+
+def tokenize_stream(input_file):
+    return sum(1 for token in JackTokenizer.stream(input_file))
+
+def measure(tokenize, input_file, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = tokenize(input_file)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count, best
+
+def link(program, directory):
+    """ Copies a program's Jack files into directory with the Jack OS of
+    project 12; Sys.jack calls a missing Array.init, so the compiled
+    Sys.vm of MathTest stands in for it """
+
+    os_files = [f for f in glob.glob(os.path.join(HERE, "..", "12", "**", "*.jack"), recursive=True)
+                if os.path.basename(f) not in ("Main.jack", "Sys.jack")]
+    program_files = glob.glob(os.path.join(program, "*.jack"))
+    names = {os.path.basename(f) for f in program_files}
+    for source in program_files + [f for f in os_files if os.path.basename(f) not in names]:
+        shutil.copy(source, directory)
+    shutil.copy(os.path.join(HERE, "..", "12", "MathTest", "Sys.vm"), directory)
+
+def run_to_halt(directory, limit):
+    """ Returns the VM commands executed until Sys.halt is reached, or
+    None if the program is still running after limit """
+
+    emulator = VMEmulator(directory)
+    start = end = emulator.functions["Sys.halt"]
+    program = emulator.program
+    while end + 1 < len(program) and program[end + 1][0] != FUNCTION:
+        end += 1
+    halts = range(start, end + 1)
+    while emulator.steps < limit:
+        if emulator.pc in halts:
+            return emulator.steps
+        emulator.run(1)
+    return None
+
+def count_commands(directory):
+    count = 0
+    for vm_file in glob.glob(os.path.join(directory, "*.vm")):
+        with open(vm_file, 'r') as f:
+            count += sum(1 for line in f if line.strip())
+    return count
+
+def measure_vm(programs, limit=STEP_LIMIT):
+    """ Compiles each program with and without the optimization passes and
+    counts the VM commands written and executed """
+
+    for program in programs:
+        print(os.path.basename(os.path.normpath(program)))
+        for name, passes in (("plain", ()), ("optimized", DEFAULT_PASSES)):
+            with tempfile.TemporaryDirectory() as tmp:
+                link(program, tmp)
+                for jack_file in sorted(glob.glob(os.path.join(tmp, "*.jack"))):
+                    compile_file(jack_file, passes=passes)
+                steps = run_to_halt(tmp, limit)
+                executed = f"{steps:,} executed" if steps is not None else f"running after {limit:,}"
+                print(f"{name:>10}: {count_commands(tmp):,} VM commands, {executed}")
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == "--vm":
+        measure_vm(args[1:] or PROGRAMS)
+        return
+    if len(args) > 1 or (args and not args[0].isdigit()):
+        print("Usage: Benchmark.py [copies] | Benchmark.py --vm [program dir...]")
+        sys.exit(1)
+    copies = int(args[0]) if args else COPIES
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = os.path.join(tmp, "Bench.jack")
+        files = synthesize(copies, input_file)
+        size = os.path.getsize(input_file)
+        print(f"{files} Jack files x {copies}: {size / 1e6:.1f} MB, best of 3")
+        for name, tokenize in (("strings", tokenize_strings), ("records", tokenize_records),
+                               ("stream", tokenize_stream)):
+            count, elapsed = measure(tokenize, input_file)
+            print(f"{name:>8}: {count:,} tokens in {elapsed:.3f}s  {count / elapsed:,.0f} tokens/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+from JackAST import (Int, Str, Keyword, Var, Index, Unary, Binary, Double, Call,
+                     Let, If, While, Do, Return)
+
+class CodeGenerator:
+    """ Writes the VM code of a class syntax tree """
+
+    ARITHMETIC = {
+        "+": "add",
+        "-": "sub",
+        "&": "and",
+        "|": "or",
+        "<": "lt",
+        ">": "gt",
+        "=": "eq"
+    }
+    CALLS = {"*": "Math.multiply", "/": "Math.divide"}
+
+    def __init__(self, vm_writer):
+        self.vm_writer = vm_writer
+        self.label_counter = 0
+
+    def new_label(self, base):
+        label = f"{base}{self.label_counter}"
+        self.label_counter += 1
+        return label
+
+    def writeClass(self, tree):
+        for subroutine in tree.subroutines:
+            self.writeSubroutine(subroutine)
+
+    def writeSubroutine(self, subroutine):
+        self.vm_writer.setLine(subroutine.line)
+        self.vm_writer.writeFunction(subroutine.name, subroutine.n_locals)
+
+        if subroutine.kind == "constructor":
+            self.vm_writer.writePush("constant", subroutine.n_fields)
+            self.vm_writer.writeCall("Memory.alloc", 1)
+            self.vm_writer.writePop("pointer", 0)  # set this = base address
+        elif subroutine.kind == "method":
+            self.vm_writer.writePush("argument", 0)
+            self.vm_writer.writePop("pointer", 0)  # set this = argument 0
+
+        self.writeStatements(subroutine.statements)
+
+    def writeStatements(self, statements):
+        for statement in statements:
+            self.vm_writer.setLine(statement.line)
+            kind = type(statement)
+            if kind is Let:
+                self.writeLet(statement)
+            elif kind is Do:
+                self.writeExpression(statement.call)
+                self.vm_writer.writePop("temp", 0)
+            elif kind is Return:
+                if statement.value is None:
+                    self.vm_writer.writePush("constant", 0)
+                else:
+                    self.writeExpression(statement.value)
+                self.vm_writer.writeReturn()
+            elif kind is If:
+                self.writeIf(statement)
+            elif kind is While:
+                self.writeWhile(statement)
+
+    def writeLet(self, statement):
+        var = statement.var
+        if statement.index is None:
+            self.writeExpression(statement.value)
+            self.vm_writer.writePop(var.segment, var.index)
+            return
+
+        self.writeExpression(statement.index)  # push index
+        self.vm_writer.writePush(var.segment, var.index)  # push base addr
+        self.vm_writer.writeArithmetic("add")  # base + index
+        self.writeExpression(statement.value)
+        # For array: save value to temp, pop pointer 1, pop that 0
+        self.vm_writer.writePop("temp", 0)  # save value
+        self.vm_writer.writePop("pointer", 1)  # that = base+index
+        self.vm_writer.writePush("temp", 0)  # value
+        self.vm_writer.writePop("that", 0)
+
+    def writeWhile(self, statement):
+        label_exp = self.new_label("WHILE_EXP")
+        if statement.condition is None:
+            # constant true condition: no test, and nothing jumps to the end
+            self.vm_writer.writeLabel(label_exp)
+            self.writeStatements(statement.body)
+            self.vm_writer.writeGoto(label_exp)
+            return
+
+        label_end = self.new_label("WHILE_END")
+        self.vm_writer.writeLabel(label_exp)
+        self.writeExpression(statement.condition)
+        self.vm_writer.writeArithmetic("not")
+        self.vm_writer.writeIf(label_end)
+        self.writeStatements(statement.body)
+        self.vm_writer.writeGoto(label_exp)
+        self.vm_writer.writeLabel(label_end)
+
+    def writeIf(self, statement):
+        label_else = self.new_label("IF_ELSE")
+        label_end = self.new_label("IF_END")
+
+        self.writeExpression(statement.condition)
+        self.vm_writer.writeArithmetic("not")
+        self.vm_writer.writeIf(label_else)
+        self.writeStatements(statement.then)  # IF body
+        self.vm_writer.writeGoto(label_end)
+        self.vm_writer.writeLabel(label_else)
+        if statement.else_ is not None:
+            self.writeStatements(statement.else_)
+        self.vm_writer.writeLabel(label_end)
+
+    def writeExpression(self, expression):
+        kind = type(expression)
+
+        if kind is Int:
+            value = expression.value
+            if value >= 0:
+                self.vm_writer.writePush("constant", value)
+            elif value == -1:
+                self.vm_writer.writePush("constant", 0)
+                self.vm_writer.writeArithmetic("not")
+            else:
+                self.vm_writer.writePush("constant", -value)
+                self.vm_writer.writeArithmetic("neg")
+
+        elif kind is Var:
+            self.vm_writer.writePush(expression.segment, expression.index)
+
+        elif kind is Binary:
+            self.writeExpression(expression.left)
+            self.writeExpression(expression.right)
+            op = expression.op
+            if op in self.CALLS:
+                self.vm_writer.writeCall(self.CALLS[op], 2)
+            else:
+                self.vm_writer.writeArithmetic(self.ARITHMETIC[op])
+
+        elif kind is Call:
+            if expression.receiver is not None:
+                self.writeExpression(expression.receiver)
+            for arg in expression.args:
+                self.writeExpression(arg)
+            n_args = len(expression.args) + (expression.receiver is not None)
+            self.vm_writer.writeCall(expression.name, n_args)
+
+        elif kind is Keyword:
+            value = expression.value
+            if value == "true":
+                self.vm_writer.writePush("constant", 0)
+                self.vm_writer.writeArithmetic("not")
+            elif value in {"false", "null"}:
+                self.vm_writer.writePush("constant", 0)
+            elif value == "this":
+                self.vm_writer.writePush("pointer", 0)
+
+        elif kind is Unary:
+            self.writeExpression(expression.operand)
+            self.vm_writer.writeArithmetic("neg" if expression.op == "-" else "not")
+
+        elif kind is Index:
+            var = expression.array
+            self.writeExpression(expression.index)
+            self.vm_writer.writePush(var.segment, var.index)
+            self.vm_writer.writeArithmetic("add")
+            self.vm_writer.writePop("pointer", 1)
+            self.vm_writer.writePush("that", 0)
+
+        elif kind is Str:
+            value = expression.value
+            self.vm_writer.writePush("constant", len(value))
+            self.vm_writer.writeCall("String.new", 1)
+            for c in value:
+                self.vm_writer.writePush("constant", ord(c))
+                self.vm_writer.writeCall("String.appendChar", 2)
+
+        elif kind is Double:
+            self.writeDouble(expression)
+
+    def writeDouble(self, expression):
+        operand = expression.operand
+        times = expression.times
+        self.writeExpression(operand)
+        if type(operand) is Var:
+            # a variable is cheaper to push again than to copy
+            self.writeExpression(operand)
+            self.vm_writer.writeArithmetic("add")
+            times -= 1
+        for _ in range(times):
+            # copy the top of the stack through temp 1, then add
+            self.vm_writer.writePop("temp", 1)
+            self.vm_writer.writePush("temp", 1)
+            self.vm_writer.writePush("temp", 1)
+            self.vm_writer.writeArithmetic("add")
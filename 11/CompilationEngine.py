@@ -1,10 +1,18 @@
+from JackAST import (Int, Str, Keyword, Var, Index, Unary, Binary, Call,
+                     Let, If, While, Do, Return, Subroutine, Class)
+from CodeGenerator import CodeGenerator
+
 class CompilationEngine:
-    def __init__(self, tokenizer, vm_writer, symbol_table):
+    """ Parses a class into a syntax tree, runs the optimization passes
+    over it and writes the VM code for the tree. Variables are resolved
+    against the symbol table while parsing. """
+
+    def __init__(self, tokenizer, vm_writer, symbol_table, passes=()):
         self.tokenizer = tokenizer
         self.vm_writer = vm_writer
         self.class_name = ""
         self.symbol_table = symbol_table
-        self.label_counter = 0
+        self.passes = passes
 
     def _eat(self, expected=None):
         token = self.tokenizer.current_token
@@ -12,11 +20,6 @@ class CompilationEngine:
             raise ValueError(f"Expected {expected}, got {token}")
         self.tokenizer.advance()
 
-    def new_label(self, base):
-        label = f"{base}{self.label_counter}"
-        self.label_counter += 1
-        return label
-
     def kindToSegment(self, kind):
         if kind == "STATIC": return "static"
         if kind == "FIELD": return "this"
@@ -24,40 +27,34 @@ class CompilationEngine:
         if kind == "VAR": return "local"
         return "none"
 
-    def compileArithmetic(self, op):
-        command_map = {
-            "+": "add",
-            "-": "sub",
-            "*": "call Math.multiply 2",
-            "/": "call Math.divide 2",
-            "&": "and",
-            "|": "or",
-            "<": "lt",
-            ">": "gt",
-            "=": "eq"
-        }
-        command = command_map[op]
-        if command.startswith("call"):
-            fn, n = command.split()[1], int(command.split()[2])
-            self.vm_writer.writeCall(fn, n)
-        else:
-            self.vm_writer.writeArithmetic(command)
+    def _var(self, name):
+        kind = self.symbol_table.kindOf(name)
+        return Var(name, self.kindToSegment(kind), self.symbol_table.indexOf(name))
 
     def compileClass(self):
+        tree = self.parseClass()
+        for optimization in self.passes:
+            optimization(tree)
+        CodeGenerator(self.vm_writer).writeClass(tree)
+        return tree
+
+    def parseClass(self):
         self._eat("class")
         self.class_name = self.tokenizer.identifier()
         self._eat(self.class_name)
         self._eat("{")
 
         while self.tokenizer.current_token in ("static", "field"):
-            self.compileClassVarDec()
+            self.parseClassVarDec()
 
+        subroutines = []
         while self.tokenizer.current_token in ("constructor", "function", "method"):
-            self.compileSubroutine()
+            subroutines.append(self.parseSubroutine())
 
         self._eat("}")
+        return Class(self.class_name, subroutines)
 
-    def compileClassVarDec(self):
+    def parseClassVarDec(self):
         kind = self.tokenizer.current_token  # static or field
         self._eat(kind)
         var_type = self.tokenizer.current_token
@@ -74,7 +71,8 @@ class CompilationEngine:
 
         self._eat(";")
 
-    def compileSubroutine(self):
+    def parseSubroutine(self):
+        line = self.tokenizer.lineNumber()
         self.symbol_table.startSubroutine()
         subroutine_type = self.tokenizer.current_token
         self._eat(subroutine_type)
@@ -86,29 +84,20 @@ class CompilationEngine:
         if subroutine_type == "method":
             # Add 'this' as the 0th argument
             self.symbol_table.define("this", self.class_name, "arg")
-        self.compileParameterList()
+        self.parseParameterList()
         self._eat(")")
         self._eat("{")
 
         while self.tokenizer.current_token == "var":
-            self.compileVarDec()
+            self.parseVarDec()
 
         n_locals = self.symbol_table.varCount("var")
-        self.vm_writer.writeFunction(full_name, n_locals)
-
-        if subroutine_type == "constructor":
-            field_count = self.symbol_table.varCount("field")
-            self.vm_writer.writePush("constant", field_count)
-            self.vm_writer.writeCall("Memory.alloc", 1)
-            self.vm_writer.writePop("pointer", 0)  # set this = base address
-        elif subroutine_type == "method":
-            self.vm_writer.writePush("argument", 0)
-            self.vm_writer.writePop("pointer", 0)  # set this = argument 0
-
-        self.compileStatements()
+        n_fields = self.symbol_table.varCount("field")
+        statements = self.parseStatements()
         self._eat("}")
+        return Subroutine(subroutine_type, full_name, n_locals, n_fields, statements, line)
 
-    def compileParameterList(self):
+    def parseParameterList(self):
         if self.tokenizer.current_token != ")":
             var_type = self.tokenizer.current_token
             self._eat(var_type)
@@ -123,7 +112,7 @@ class CompilationEngine:
                 self.symbol_table.define(name, var_type, "arg")
                 self._eat(name)
 
-    def compileVarDec(self):
+    def parseVarDec(self):
         self._eat("var")
         var_type = self.tokenizer.current_token
         self._eat(var_type)
@@ -137,164 +126,119 @@ class CompilationEngine:
             self._eat(name)
         self._eat(";")
 
-    def compileStatements(self):
+    def parseStatements(self):
+        statements = []
         while self.tokenizer.current_token in ("let", "if", "while", "do", "return"):
+            line = self.tokenizer.lineNumber()
             if self.tokenizer.current_token == "let":
-                self.compileLet()
+                statement = self.parseLet()
             elif self.tokenizer.current_token == "do":
-                self.compileDo()
+                statement = self.parseDo()
             elif self.tokenizer.current_token == "return":
-                self.compileReturn()
+                statement = self.parseReturn()
             elif self.tokenizer.current_token == "if":
-                self.compileIf()
-            elif self.tokenizer.current_token == "while":
-                self.compileWhile()
+                statement = self.parseIf()
+            else:
+                statement = self.parseWhile()
+            statement.line = line
+            statements.append(statement)
+        return statements
 
-    def compileLet(self):
+    def parseLet(self):
         self._eat("let")
         var_name = self.tokenizer.identifier()
         self._eat(var_name)
 
-        is_array = False
+        index = None
         if self.tokenizer.current_token == "[":
-            is_array = True
             self._eat("[")
-            self.compileExpression()  # push index
+            index = self.parseExpression()
             self._eat("]")
 
-            kind = self.symbol_table.kindOf(var_name)
-            index = self.symbol_table.indexOf(var_name)
-            segment = self.kindToSegment(kind)
-            self.vm_writer.writePush(segment, index)  # push base addr
-            self.vm_writer.writeArithmetic("add")  # base + index
-
         self._eat("=")
-        self.compileExpression()
+        value = self.parseExpression()
         self._eat(";")
+        return Let(self._var(var_name), index, value, None)
 
-        if is_array:
-            # For array: save value to temp, pop pointer 1, pop that 0
-            self.vm_writer.writePop("temp", 0)  # save value
-            self.vm_writer.writePop("pointer", 1)  # that = base+index
-            self.vm_writer.writePush("temp", 0)  # value
-            self.vm_writer.writePop("that", 0)
-        else:
-            kind = self.symbol_table.kindOf(var_name)
-            index = self.symbol_table.indexOf(var_name)
-            segment = self.kindToSegment(kind)
-            self.vm_writer.writePop(segment, index)
-
-    def compileDo(self):
+    def parseDo(self):
         self._eat("do")
-        self.compileSubroutineCall()
+        call = self.parseSubroutineCall()
         self._eat(";")
-        self.vm_writer.writePop("temp", 0)
+        return Do(call, None)
 
-    def compileReturn(self):
+    def parseReturn(self):
         self._eat("return")
+        value = None
         if self.tokenizer.current_token != ";":
-            self.compileExpression()
-        else:
-            self.vm_writer.writePush("constant", 0)
+            value = self.parseExpression()
         self._eat(";")
-        self.vm_writer.writeReturn()
-
-    def compileWhile(self):
-        label_exp = self.new_label("WHILE_EXP")
-        label_end = self.new_label("WHILE_END")
-
-        self.vm_writer.writeLabel(label_exp)
+        return Return(value, None)
 
+    def parseWhile(self):
         self._eat("while")
         self._eat("(")
-        self.compileExpression()
+        condition = self.parseExpression()
         self._eat(")")
 
-        self.vm_writer.writeArithmetic("not")
-        self.vm_writer.writeIf(label_end)
-
         self._eat("{")
-        self.compileStatements()
+        body = self.parseStatements()
         self._eat("}")
+        return While(condition, body, None)
 
-        self.vm_writer.writeGoto(label_exp)
-        self.vm_writer.writeLabel(label_end)
-
-    def compileIf(self):
-        label_else = self.new_label("IF_ELSE")
-        label_end = self.new_label("IF_END")
-
+    def parseIf(self):
         self._eat("if")
         self._eat("(")
-        self.compileExpression()
+        condition = self.parseExpression()
         self._eat(")")
 
-        self.vm_writer.writeArithmetic("not")
-        self.vm_writer.writeIf(label_else)
-
         self._eat("{")
-        self.compileStatements()  # IF body
+        then = self.parseStatements()  # IF body
         self._eat("}")
 
-        self.vm_writer.writeGoto(label_end)
-        self.vm_writer.writeLabel(label_else)
-
+        else_ = None
         if self.tokenizer.current_token == "else":
             self._eat("else")
             self._eat("{")
-            self.compileStatements()
+            else_ = self.parseStatements()
             self._eat("}")
+        return If(condition, then, else_, None)
 
-        self.vm_writer.writeLabel(label_end)
-
-    def compileExpression(self):
-        self.compileTerm()
+    def parseExpression(self):
+        # no precedence: operators apply left to right
+        expression = self.parseTerm()
         while self.tokenizer.current_token in ('+', '-', '*', '/', '&', '|', '<', '>', '='):
             op = self.tokenizer.current_token
             self._eat(op)
-            self.compileTerm()
-            self.compileArithmetic(op)
+            expression = Binary(op, expression, self.parseTerm())
+        return expression
 
-    def compileTerm(self):
+    def parseTerm(self):
         token_type = self.tokenizer.tokenType()
         token = self.tokenizer.current_token
 
         if token_type == "integerConstant":
-            self.vm_writer.writePush("constant", int(token))
             self._eat(token)
+            return Int(int(token))
 
         elif token_type == "stringConstant":
             value = self.tokenizer.stringVal()
             self._eat(token)
-            self.vm_writer.writePush("constant", len(value))
-            self.vm_writer.writeCall("String.new", 1)
-            for c in value:
-                self.vm_writer.writePush("constant", ord(c))
-                self.vm_writer.writeCall("String.appendChar", 2)
+            return Str(value)
 
         elif token_type == "keyword" and token in {"true", "false", "null", "this"}:
             self._eat(token)
-            if token == "true":
-                self.vm_writer.writePush("constant", 0)
-                self.vm_writer.writeArithmetic("not")
-            elif token in {"false", "null"}:
-                self.vm_writer.writePush("constant", 0)
-            elif token == "this":
-                self.vm_writer.writePush("pointer", 0)
+            return Keyword(token)
 
         elif token_type == "symbol" and token == "(":
             self._eat("(")
-            self.compileExpression()
+            expression = self.parseExpression()
             self._eat(")")
+            return expression
 
         elif token_type == "symbol" and token in {"-", "~"}:
             op = token
             self._eat(op)
-            self.compileTerm()
-            if op == "-":
-                self.vm_writer.writeArithmetic("neg")
-            else:
-                self.vm_writer.writeArithmetic("not")
+            return Unary(op, self.parseTerm())
 
         elif token_type == "identifier":
             next_token = self.tokenizer.peek()
@@ -303,28 +247,17 @@ class CompilationEngine:
                 var_name = token
                 self._eat(var_name)
                 self._eat("[")
-                self.compileExpression()
+                index = self.parseExpression()
                 self._eat("]")
-
-                kind = self.symbol_table.kindOf(var_name)
-                index = self.symbol_table.indexOf(var_name)
-                segment = self.kindToSegment(kind)
-                self.vm_writer.writePush(segment, index)
-                self.vm_writer.writeArithmetic("add")
-                self.vm_writer.writePop("pointer", 1)
-                self.vm_writer.writePush("that", 0)
+                return Index(self._var(var_name), index)
 
             elif next_token in {"(", "."}:
-                self.compileSubroutineCall()
+                return self.parseSubroutineCall()
             else:
-                kind = self.symbol_table.kindOf(token)
-                index = self.symbol_table.indexOf(token)
-                segment = self.kindToSegment(kind)
-                self.vm_writer.writePush(segment, index)
                 self._eat(token)
+                return self._var(token)
 
-    def compileSubroutineCall(self):
-        n_args = 0
+    def parseSubroutineCall(self):
         name = self.tokenizer.identifier()
         self._eat(name)
 
@@ -337,32 +270,27 @@ class CompilationEngine:
             if kind is not None:
                 # 'name' is a variable referring to an object instance
                 type_name = self.symbol_table.typeOf(name)
-                segment = self.kindToSegment(kind)
-                index = self.symbol_table.indexOf(name)
-                self.vm_writer.writePush(segment, index)
+                receiver = self._var(name)
                 full_name = f"{type_name}.{subroutine_name}"
-                n_args += 1
             else:
                 # 'name' is a class name
+                receiver = None
                 full_name = f"{name}.{subroutine_name}"
         else:
             # method call
             full_name = f"{self.class_name}.{name}"
-            self.vm_writer.writePush("pointer", 0)
-            n_args += 1
+            receiver = Keyword("this")
 
         self._eat("(")
-        n_args += self.compileExpressionList()
+        args = self.parseExpressionList()
         self._eat(")")
-        self.vm_writer.writeCall(full_name, n_args)
+        return Call(full_name, receiver, args)
 
-    def compileExpressionList(self):
-        n_args = 0
+    def parseExpressionList(self):
+        args = []
         if self.tokenizer.current_token != ")":
-            self.compileExpression()
-            n_args += 1
+            args.append(self.parseExpression())
             while self.tokenizer.current_token == ",":
                 self._eat(",")
-                self.compileExpression()
-                n_args += 1
-        return n_args
+                args.append(self.parseExpression())
+        return args
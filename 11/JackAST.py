@@ -0,0 +1,79 @@
+class Node:
+    """ Base of the syntax tree nodes; subclasses list their fields in __slots__ """
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        fields = ", ".join(repr(getattr(self, name)) for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+# expressions
+
+class Int(Node):
+    """ An integer constant; folded constants may be negative """
+    __slots__ = ('value',)
+
+class Str(Node):
+    __slots__ = ('value',)
+
+class Keyword(Node):
+    """ true, false, null or this """
+    __slots__ = ('value',)
+
+class Var(Node):
+    """ A variable, resolved to its segment and index while parsing """
+    __slots__ = ('name', 'segment', 'index')
+
+class Index(Node):
+    """ array[index] """
+    __slots__ = ('array', 'index')
+
+class Unary(Node):
+    __slots__ = ('op', 'operand')
+
+class Binary(Node):
+    __slots__ = ('op', 'left', 'right')
+
+class Double(Node):
+    """ operand * 2**times, as `times` additions """
+    __slots__ = ('operand', 'times')
+
+class Call(Node):
+    """ A call to the function `name`; receiver is the object pushed as
+    argument 0 of a method call (a Var or Keyword this), or None """
+    __slots__ = ('name', 'receiver', 'args')
+
+# statements, each with the source line it starts on
+
+class Let(Node):
+    """ let var = value, or let var[index] = value """
+    __slots__ = ('var', 'index', 'value', 'line')
+
+class If(Node):
+    """ else_ is None when there is no else part """
+    __slots__ = ('condition', 'then', 'else_', 'line')
+
+class While(Node):
+    """ A condition of None loops forever """
+    __slots__ = ('condition', 'body', 'line')
+
+class Do(Node):
+    __slots__ = ('call', 'line')
+
+class Return(Node):
+    """ value is None for a bare return """
+    __slots__ = ('value', 'line')
+
+# declarations
+
+class Subroutine(Node):
+    """ kind is constructor, function or method; n_fields is the number of
+    fields a constructor allocates """
+    __slots__ = ('kind', 'name', 'n_locals', 'n_fields', 'statements', 'line')
+
+class Class(Node):
+    __slots__ = ('name', 'subroutines')
@@ -1,9 +1,21 @@
 import os
 import sys
+import time
 from JackTokenizer import JackTokenizer
 from CompilationEngine import CompilationEngine
 from VMWriter import VMWriter
 from SymbolTable import SymbolTable
+from Optimizer import PASSES, DEFAULT_PASSES
+
+# the build cache of the assembler; appended, so that this project's
+# SymbolTable is not shadowed by project 6's
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "6"))
+from Cache import Cache
+
+VERSION = "1.0" # bump when output changes, to invalidate cached classes
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "jack-compiler")
+CACHE_SIZE = 64 * 1024 * 1024
+POLL_INTERVAL = 0.25 # seconds between checks for changed files in watch mode
 
 def is_jack_file(path):
     return os.path.isfile(path) and path.endswith(".jack")
@@ -12,7 +24,7 @@ def get_jack_files(path):
     if os.path.isdir(path):
         return [
             os.path.join(path, f)
-            for f in os.listdir(path)
+            for f in sorted(os.listdir(path))
             if f.endswith(".jack")
         ]
     elif is_jack_file(path):
@@ -20,31 +32,157 @@ def get_jack_files(path):
     else:
         return []
 
-def compile_file(jack_file):
+def compile_file(jack_file, source_map=False, passes=()):
+    """ Compiles a class, running the named optimization passes in order """
+
     base_name = os.path.splitext(jack_file)[0]
     vm_file = base_name + ".vm"
 
     tokenizer = JackTokenizer(jack_file)
-    vm_writer = VMWriter(vm_file)
+    vm_writer = VMWriter(vm_file, jack_file if source_map else None)
     symbol_table = SymbolTable()
-    engine = CompilationEngine(tokenizer, vm_writer, symbol_table)
+    engine = CompilationEngine(tokenizer, vm_writer, symbol_table,
+                               [PASSES[name] for name in passes])
     engine.compileClass()
     vm_writer.close()
 
+def vm_path(jack_file):
+    return os.path.splitext(jack_file)[0] + ".vm"
+
+def compile_files(jack_files, jobs=1, source_map=False, cache=None, passes=()):
+    """ Compiles each file on its own, on `jobs` processes. Errors are
+    reported in the order of jack_files; returns the number of failures.
+    Files whose output is cached are not compiled again; source maps are
+    not cached, so source_map compiles every file. """
+
+    if cache and not source_map:
+        options = ",".join(passes) # the passes run decide the output
+        jack_files = [f for f in jack_files if not cache.restore(f, vm_path(f), options)]
+    work = [(jack_file, source_map, passes) for jack_file in jack_files]
+    if jobs > 1 and len(work) > 1:
+        # imported here: it takes longer to load than a cached rebuild
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_compile_job, work))
+    else:
+        results = [_compile_job(job) for job in work]
+
+    failed = 0
+    for jack_file, (error, seconds) in zip(jack_files, results):
+        if error:
+            print(error, file=sys.stderr)
+            failed += 1
+        elif cache and not source_map:
+            cache.store(jack_file, vm_path(jack_file), seconds)
+
+    if cache and not source_map:
+        cache.save()
+        print(cache.stats())
+    return failed
+
+def _compile_job(job):
+    jack_file, source_map, passes = job
+    start = time.perf_counter()
+    try:
+        compile_file(jack_file, source_map, passes)
+    except Exception as e:
+        return f"{jack_file}: {type(e).__name__}: {e}", 0.0
+    return None, time.perf_counter() - start
+
+def watch(paths, jobs=1, source_map=False, cache=None, passes=(), interval=POLL_INTERVAL):
+    """ Compiles the .jack files under paths, then polls their modification
+    times every `interval` seconds and recompiles the files that changed
+    or appeared, until interrupted """
+
+    stamps = {}
+    while True:
+        current = {}
+        for jack_file in [f for path in paths for f in get_jack_files(path)]:
+            try:
+                current[jack_file] = os.stat(jack_file).st_mtime_ns
+            except OSError: # removed since it was listed
+                pass
+        changed = [f for f in current if stamps.get(f) != current[f]]
+        stamps = current
+
+        if changed:
+            start = time.perf_counter()
+            failed = compile_files(changed, jobs, source_map, cache, passes)
+            elapsed = time.perf_counter() - start
+            print(f"compiled {len(changed)} files in {elapsed * 1000:.0f} ms"
+                  + (f", {failed} failed" if failed else ""), flush=True)
+        time.sleep(interval)
+
+def parse_args(argv):
+    """ Returns (paths, options) or None if argv is malformed """
+
+    options = {"jobs": 1, "source_map": False, "watch": False, "passes": [],
+               "cache": False, "cache_dir": CACHE_DIR, "cache_size": CACHE_SIZE}
+    paths = []
+    args = iter(argv)
+    for arg in args:
+        name, eq, value = arg.partition("=")
+        if name in ("--jobs", "--cache-dir", "--cache-size"):
+            if not eq:
+                value = next(args, "")
+            if name == "--cache-dir" and value:
+                options["cache"] = True
+                options["cache_dir"] = value
+            elif name == "--jobs" and value.isdigit():
+                options["jobs"] = int(value) or os.cpu_count() or 1
+            elif name == "--cache-size" and value.isdigit():
+                options["cache_size"] = int(value) * 1024 * 1024
+            else:
+                return None
+        elif arg == "--source-map":
+            options["source_map"] = True
+        elif arg == "--cache":
+            options["cache"] = True
+        elif arg == "--watch":
+            options["watch"] = True
+        elif arg == "--optimize":
+            options["passes"] = DEFAULT_PASSES
+        elif name == "--optimize" and value:
+            options["passes"] = value.split(",")
+            if not all(p in PASSES for p in options["passes"]):
+                return None
+        elif arg.startswith("--"):
+            return None
+        else:
+            paths.append(arg)
+
+    if not paths:
+        return None
+    return paths, options
+
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: JackCompiler.py <path>")
+    parsed = parse_args(sys.argv[1:])
+    if not parsed:
+        print("Usage: JackCompiler.py [--jobs N] [--optimize[=fold,strength,branches]] "
+              "[--source-map] [--watch] "
+              "[--cache] [--cache-dir DIR] [--cache-size MB] <path> ...")
+        return
+
+    paths, options = parsed
+    cache = None
+    if options["cache"]:
+        cache = Cache(options["cache_dir"], VERSION, options["cache_size"])
+
+    if options["watch"]:
+        try:
+            watch(paths, options["jobs"], options["source_map"], cache, options["passes"])
+        except KeyboardInterrupt:
+            pass
         return
 
-    input_path = sys.argv[1]
-    jack_files = get_jack_files(input_path)
+    jack_files = [jack_file for path in paths for jack_file in get_jack_files(path)]
 
     if not jack_files:
         print("No .jack files found.")
         return
 
-    for jack_file in jack_files:
-        compile_file(jack_file)
+    if compile_files(jack_files, options["jobs"], options["source_map"], cache, options["passes"]):
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
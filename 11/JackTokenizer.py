@@ -1,3 +1,4 @@
+import mmap
 import re
 
 KEYWORDS = {
@@ -8,15 +9,30 @@ KEYWORDS = {
 
 SYMBOLS = set('{}()[].,;+-*/&|<>=~')
 
+# one alternative per token kind; the name of the group that matched is the
+# kind. Comments and newlines are matched so they can be skipped (a `//`
+# inside a string is part of the string); other whitespace is never matched.
+TOKEN_PATTERN = re.compile(
+    r'(?P<newline>\n)'
+    r'|(?P<comment>//[^\n]*|/\*.*?\*/)'
+    r'|(?P<stringConstant>"[^"\n]*")'
+    r'|(?P<symbol>[\{\}\(\)\[\]\.\,\;\+\-\*\/\&\|\<\>\=\~])'
+    r'|(?P<keyword>(?:' + '|'.join(sorted(KEYWORDS)) + r')\b)'
+    r'|(?P<identifier>[A-Za-z_]\w*)'
+    r'|(?P<integerConstant>\d+)',
+    re.DOTALL
+)
+BYTES_PATTERN = re.compile(TOKEN_PATTERN.pattern.encode(), re.DOTALL)
+
 class JackTokenizer:
     def __init__(self, input_file):
         with open(input_file, 'r') as f:
             code = f.read()
 
-        clean_code = self._clean(code)
-        self.tokens = self._tokenize(clean_code)
+        self.tokens = self._tokenize(code)
         self.index = 1
-        self.current_token = self.tokens[0]
+        self.current = self.tokens[0]
+        self.current_token = self.current[1]
         self.tokens_len = len(self.tokens)
 
     def hasMoreTokens(self):
@@ -24,28 +40,26 @@ class JackTokenizer:
 
     def advance(self):
         if self.index < self.tokens_len:
-            self.current_token = self.tokens[self.index]
+            self.current = self.tokens[self.index]
+            self.current_token = self.current[1]
             self.index += 1
         else:
             self.current_token = None
 
+    def lineNumber(self):
+        """ Returns the source line of the current token """
+        return self.current[2]
+
+    def column(self):
+        return self.current[3]
+
     def peek(self):
         if self.hasMoreTokens():
-            return self.tokens[self.index]
+            return self.tokens[self.index][1]
         return None
 
     def tokenType(self):
-        token = self.current_token
-        if token in KEYWORDS:
-            return "keyword"
-        elif token in SYMBOLS:
-            return "symbol"
-        elif token.isdigit():
-            return "integerConstant"
-        elif token.startswith('"') and token.endswith('"'):
-            return "stringConstant"
-        else:
-            return "identifier"
+        return self.current[0]
 
     def keyword(self):
         return self.current_token
@@ -62,20 +76,37 @@ class JackTokenizer:
     def stringVal(self):
         return self.current_token.strip('"')
 
+    @staticmethod
+    def stream(input_file):
+        """ Yields the file's tokens lazily, scanning it through mmap
+        instead of reading it into memory; columns count bytes """
+
+        with open(input_file, 'rb') as f:
+            if not f.seek(0, 2):
+                return # mmap cannot map an empty file
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as code:
+                for kind, value, line, col in JackTokenizer._scan(code, BYTES_PATTERN, b'\n'):
+                    yield kind, value.decode(), line, col
+
     def _tokenize(self, code):
-        """ Returns list of tokens, ignoring whitespace """
-
-        pattern = re.compile(
-            r'"[^"\n]*"' # stringConstant
-            r'|[\{\}\(\)\[\]\.\,\;\+\-\*\/\&\|\<\>\=\~]' # symbol
-            r'|[A-Za-z_]\w*' # identifier & keyword
-            r'|\d+' # integerConstant
-        )
-        return pattern.findall(code)
-
-    def _clean(self, code):
-        # /* ... */ and /** ... */ comments
-        code = re.sub(r'/\*\*?.*?\*/', '', code, flags=re.DOTALL)
-        # // comments
-        code = re.sub(r'//.*', '', code)
-        return code
\ No newline at end of file
+        """ Returns a (kind, value, line, col) tuple per token, ignoring
+        whitespace and comments. Line and column are 1-based. """
+
+        return list(self._scan(code, TOKEN_PATTERN, '\n'))
+
+    @staticmethod
+    def _scan(code, pattern, newline):
+        line = 1
+        line_start = 0
+        for match in pattern.finditer(code):
+            kind = match.lastgroup
+            if kind == 'newline':
+                line += 1
+                line_start = match.end()
+            elif kind == 'comment':
+                text = match.group()
+                if newline in text:
+                    line += text.count(newline)
+                    line_start = match.start() + text.rindex(newline) + 1
+            else:
+                yield kind, match.group(), line, match.start() - line_start + 1
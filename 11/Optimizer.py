@@ -0,0 +1,203 @@
+from JackAST import (Int, Keyword, Var, Index, Unary, Binary, Double, Call,
+                     Let, If, While, Do, Return)
+
+# Each pass takes a Class tree and rewrites it in place. Values are 16-bit:
+# constants are only folded when the result is unambiguous, i.e. fits in
+# -32767..32767 and does not depend on how Math.multiply/divide overflow.
+
+MAX_INT = 32767
+TRUE, FALSE = -1, 0
+CONSTANTS = {"true": TRUE, "false": FALSE, "null": 0}
+
+def constant(expression):
+    """ Returns the value of a constant expression, or None """
+
+    kind = type(expression)
+    if kind is Int:
+        return expression.value
+    if kind is Keyword:
+        return CONSTANTS.get(expression.value)
+    return None
+
+def pure(expression):
+    """ True if evaluating the expression has no side effects """
+
+    kind = type(expression)
+    if kind in (Int, Keyword, Var):
+        return True
+    if kind is Index:
+        return pure(expression.index)
+    if kind is Unary:
+        return pure(expression.operand)
+    if kind is Binary:
+        # * and / call into the OS, which may report errors
+        return expression.op not in "*/" and pure(expression.left) and pure(expression.right)
+    return False
+
+def rewrite(expression, fold):
+    """ Rebuilds an expression bottom-up, replacing each node by fold(node) """
+
+    kind = type(expression)
+    if kind is Binary:
+        expression.left = rewrite(expression.left, fold)
+        expression.right = rewrite(expression.right, fold)
+    elif kind in (Unary, Double):
+        expression.operand = rewrite(expression.operand, fold)
+    elif kind is Index:
+        expression.index = rewrite(expression.index, fold)
+    elif kind is Call:
+        expression.args = [rewrite(arg, fold) for arg in expression.args]
+    elif expression is None:
+        return None
+    return fold(expression)
+
+def rewrite_statements(statements, fold):
+    for statement in statements:
+        kind = type(statement)
+        if kind is Let:
+            if statement.index is not None:
+                statement.index = rewrite(statement.index, fold)
+            statement.value = rewrite(statement.value, fold)
+        elif kind is Do:
+            statement.call = rewrite(statement.call, fold)
+        elif kind is Return:
+            if statement.value is not None:
+                statement.value = rewrite(statement.value, fold)
+        elif kind is If:
+            statement.condition = rewrite(statement.condition, fold)
+            rewrite_statements(statement.then, fold)
+            if statement.else_ is not None:
+                rewrite_statements(statement.else_, fold)
+        elif kind is While:
+            if statement.condition is not None:
+                statement.condition = rewrite(statement.condition, fold)
+            rewrite_statements(statement.body, fold)
+
+def rewrite_class(tree, fold):
+    for subroutine in tree.subroutines:
+        rewrite_statements(subroutine.statements, fold)
+
+def _fold(expression):
+    kind = type(expression)
+    if kind is Unary:
+        value = constant(expression.operand)
+        if value is None:
+            return expression
+        value = -value if expression.op == "-" else ~value
+        if -MAX_INT <= value <= MAX_INT:
+            return Int(value)
+        return expression
+    if kind is not Binary:
+        return expression
+
+    op = expression.op
+    left = constant(expression.left)
+    right = constant(expression.right)
+    if left is not None and right is not None:
+        if op == "+":
+            value = left + right
+        elif op == "-":
+            value = left - right
+        elif op == "*":
+            value = left * right
+        elif op == "/":
+            if left < 0 or right <= 0: # leave signs and division by zero to Math.divide
+                return expression
+            value = left // right
+        elif op == "&":
+            value = left & right
+        elif op == "|":
+            value = left | right
+        elif op == "<":
+            value = -(left < right)
+        elif op == ">":
+            value = -(left > right)
+        else:
+            value = -(left == right)
+        if -MAX_INT <= value <= MAX_INT:
+            return Int(value)
+        return expression
+
+    # identities: x+0, 0+x, x-0, x*1, 1*x, x/1, and x*0 when x has no side effects
+    if (op == "+" and left == 0) or (op == "*" and left == 1):
+        return expression.right
+    if (op in "+-" and right == 0) or (op in "*/" and right == 1):
+        return expression.left
+    if op == "*" and ((left == 0 and pure(expression.right)) or (right == 0 and pure(expression.left))):
+        return Int(0)
+    return expression
+
+def fold_constants(tree):
+    """ Evaluates operators on constants at compile time and drops identities """
+
+    rewrite_class(tree, _fold)
+
+def _power_of_two(value):
+    """ Returns k if value is 2**k with k >= 1, else None """
+
+    if value is not None and value > 1 and value & (value - 1) == 0:
+        return value.bit_length() - 1
+    return None
+
+def _reduce(expression):
+    if type(expression) is not Binary or expression.op != "*":
+        return expression
+    times = _power_of_two(constant(expression.right))
+    if times is not None:
+        return Double(expression.left, times)
+    times = _power_of_two(constant(expression.left))
+    if times is not None:
+        return Double(expression.right, times)
+    return expression
+
+def reduce_strength(tree):
+    """ Turns multiplication by a power of two into additions instead of a
+    call to Math.multiply. Division has no cheap VM equivalent and is left
+    alone. """
+
+    rewrite_class(tree, _reduce)
+
+def _eliminate(statements):
+    result = []
+    for statement in statements:
+        kind = type(statement)
+        if kind is If:
+            _eliminate_in(statement)
+            value = constant(statement.condition)
+            if value in (TRUE, FALSE):
+                # keep only the branch that runs
+                result += statement.then if value == TRUE else (statement.else_ or [])
+                continue
+        elif kind is While:
+            _eliminate_in(statement)
+            value = constant(statement.condition)
+            if value == FALSE:
+                continue
+            if value == TRUE:
+                statement.condition = None
+        result.append(statement)
+    return result
+
+def _eliminate_in(statement):
+    if type(statement) is If:
+        statement.then = _eliminate(statement.then)
+        if statement.else_ is not None:
+            statement.else_ = _eliminate(statement.else_)
+    else:
+        statement.body = _eliminate(statement.body)
+
+def eliminate_dead_branches(tree):
+    """ Replaces an if whose condition is true or false by the branch that
+    runs, drops while loops that never run, and removes the test of loops
+    whose condition is always true. The code generated branches on `not`,
+    so only -1 counts as true: other constants are left alone. """
+
+    for subroutine in tree.subroutines:
+        subroutine.statements = _eliminate(subroutine.statements)
+
+PASSES = {
+    "fold": fold_constants,
+    "strength": reduce_strength,
+    "branches": eliminate_dead_branches,
+}
+DEFAULT_PASSES = ["fold", "strength", "branches"]
@@ -1,35 +1,63 @@
+import os
+
 class VMWriter:
-    def __init__(self, output_file):
+    def __init__(self, output_file, source_file=None):
         self.out = open(output_file, 'w')
+        # with a source file, a sidecar <output>.map maps VM lines to its lines
+        self.map_file = output_file + '.map' if source_file else None
+        self.source = None
+        if source_file:
+            self.source = os.path.relpath(source_file, os.path.dirname(os.path.abspath(output_file)))
+        self.vm_line = 0
+        self.line = None
+        self.runs = [] # (first VM line, source line) of each run of lines
+
+    def setLine(self, line):
+        """ Attributes the commands written from now on to source line `line` """
+        self.line = line
+
+    def _write(self, command):
+        self.out.write(command + '\n')
+        self.vm_line += 1
+        if self.runs and self.runs[-1][1] == self.line:
+            return
+        self.runs.append((self.vm_line, self.line))
 
     def writePush(self, segment, index):
         if segment is None or index is None:
             raise ValueError(f"Invalid push: segment={segment}, index={index}")
-        self.out.write(f'push {segment.lower()} {index}\n')
+        self._write(f'push {segment.lower()} {index}')
 
     def writePop(self, segment, index):
-        self.out.write(f'pop {segment.lower()} {index}\n')
+        self._write(f'pop {segment.lower()} {index}')
 
     def writeArithmetic(self, command):
-        self.out.write(f'{command.lower()}\n')
+        self._write(f'{command.lower()}')
 
     def writeLabel(self, label):
-        self.out.write(f'label {label}\n')
+        self._write(f'label {label}')
 
     def writeGoto(self, label):
-        self.out.write(f'goto {label}\n')
+        self._write(f'goto {label}')
 
     def writeIf(self, label):
-        self.out.write(f'if-goto {label}\n')
+        self._write(f'if-goto {label}')
 
     def writeCall(self, name, n_args):
-        self.out.write(f'call {name} {n_args}\n')
+        self._write(f'call {name} {n_args}')
 
     def writeFunction(self, name, n_locals):
-        self.out.write(f'function {name} {n_locals}\n')
+        self._write(f'function {name} {n_locals}')
 
     def writeReturn(self):
-        self.out.write('return\n')
+        self._write('return')
 
     def close(self):
-        self.out.close()
\ No newline at end of file
+        self.out.close()
+        if self.map_file:
+            # same format as the assembler's source maps: file table, then
+            # "<first line> <file index> <source line>" per run
+            with open(self.map_file, 'w') as f:
+                f.write(f'file {self.source}\n')
+                for vm_line, line in self.runs:
+                    f.write(f'{vm_line} 0 {line}\n' if line else f'{vm_line}\n')
@@ -1,39 +1,199 @@
 import os
 import sys
-from Parser import Parser
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from Parser import Parser, A_COMMAND, C_COMMAND, L_COMMAND
 from Code import Code
+from Cache import Cache
 from SymbolTable import SymbolTable
+from SourceMap import rom_map
 
-def assemble_dir(directory):
-    for f in os.listdir(directory):
-        if f.endswith(".asm"):
-            assemble_file(os.path.join(directory, f))
+VERSION = "1.1" # bump when output changes, to invalidate cached builds
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "hack-assembler")
+CACHE_SIZE = 64 * 1024 * 1024
+STREAM_CHUNK = 4096 # words buffered before each write when streaming
 
-def assemble_file(input_file):
+def assemble_dir(directory, mode="two-pass", binary=False, jobs=1, cache=None, source_map=False):
+    """ Assembles every .asm file in directory, on `jobs` processes.
+    Errors are reported in file name order; returns the number of failures. """
+
+    asm_files = sorted(f for f in os.listdir(directory) if f.endswith(".asm"))
+    asm_files = [os.path.join(directory, f) for f in asm_files]
+    return assemble_files(asm_files, mode, binary, jobs, cache, source_map)
+
+def assemble_files(asm_files, mode="two-pass", binary=False, jobs=1, cache=None, source_map=False):
+    if cache:
+        output_format = "hackbin" if binary else "hack"
+        restored = [f for f in asm_files if cache.restore(f, output_path(f, binary), output_format)]
+        if source_map:
+            # maps depend on the translator's sidecars, so they are not cached
+            for f in restored:
+                write_source_map(f, binary)
+        asm_files = [f for f in asm_files if f not in restored]
+    work = [(f, mode, binary, source_map) for f in asm_files]
+
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_assemble_job, work))
+    else:
+        results = [_assemble_job(job) for job in work]
+
+    errors = 0
+    for input_file, (error, seconds) in zip(asm_files, results):
+        if error:
+            print(error, file=sys.stderr)
+            errors += 1
+        elif cache:
+            cache.store(input_file, output_path(input_file, binary), seconds)
+
+    if cache:
+        cache.save()
+        print(cache.stats())
+    return errors
+
+def _assemble_job(job):
+    input_file, mode, binary, source_map = job
+    start = time.perf_counter()
+    try:
+        MODES[mode](input_file, binary, source_map)
+    except Exception as e:
+        return f"{input_file}: {type(e).__name__}: {e}", 0.0
+    return None, time.perf_counter() - start
+
+def format_hack(words):
+    """ Returns words as text, one 16-character binary line per word """
+
+    if not words:
+        return ''
+    return '\n'.join([format(word, '016b') for word in words]) + '\n'
+
+def pack_hackbin(words):
+    """ Returns words packed as little-endian 16-bit values, 2 bytes each """
+
+    packed = array('H', words)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed
+
+def write_hack(output_file, words):
+    with open(output_file, 'w') as out:
+        out.write(format_hack(words))
+
+def write_hackbin(output_file, words):
+    with open(output_file, 'wb') as out:
+        pack_hackbin(words).tofile(out)
+
+def output_path(input_file, binary=False):
+    return os.path.splitext(input_file)[0] + (".hackbin" if binary else ".hack")
+
+def write_output(input_file, words, binary=False):
+    if binary:
+        write_hackbin(output_path(input_file, binary), words)
+    else:
+        write_hack(output_path(input_file, binary), words)
+
+def write_source_map(input_file, binary=False):
+    """ Writes <output>.map from the ROM addresses to their sources """
+
+    rom_map(input_file).save(output_path(input_file, binary) + ".map")
+
+def assemble_file(input_file, binary=False, source_map=False):
     parser = Parser(input_file)
     symbol_table = SymbolTable()
 
     rom_address = 0
-    while parser.has_more_commands():
-        parser.advance()
-        if parser.command_type() == "L_COMMAND":
-            symbol = parser.symbol()
-            symbol_table.add_entry(symbol, rom_address)
-        elif parser.command_type() in ("A_COMMAND", "C_COMMAND"):
+    for instruction in parser.instructions:
+        if instruction.kind == L_COMMAND:
+            symbol_table.add_entry(instruction.symbol, rom_address)
+        else:
             rom_address += 1
 
-    output_file = os.path.splitext(input_file)[0] + ".hack"
-    parser.reset()
     code = Code()
     ram_address = 16
+    words = []
 
-    with open(output_file, 'w') as out:
-        while parser.has_more_commands():
-            parser.advance()
-            cmd_type = parser.command_type()
+    for instruction in parser.instructions:
+        kind = instruction.kind
+
+        if kind == A_COMMAND:
+            symbol = instruction.symbol
+            if symbol.isdigit():
+                address = int(symbol)
+            else:
+                if not symbol_table.contains(symbol):
+                    symbol_table.add_entry(symbol, ram_address)
+                    ram_address += 1
+                address = symbol_table.get_address(symbol)
+            words.append(address)
+
+        elif kind == C_COMMAND:
+            words.append(code.encode(instruction.dest, instruction.comp, instruction.jump))
+
+    write_output(input_file, words, binary)
+    if source_map:
+        write_source_map(input_file, binary)
+
+def assemble_file_single_pass(input_file, binary=False, source_map=False):
+    """ Assembles in one sweep: forward label references are recorded as
+    fixups and backpatched once every label is known. """
+
+    symbol_table = SymbolTable()
+    code = Code()
+    words = []
+    fixups = []
+
+    for instruction in Parser.stream(input_file):
+        if instruction.kind == L_COMMAND:
+            symbol_table.add_entry(instruction.symbol, len(words))
+        elif instruction.kind == A_COMMAND:
+            symbol = instruction.symbol
+            if symbol.isdigit():
+                words.append(int(symbol))
+            elif symbol_table.contains(symbol):
+                words.append(symbol_table.get_address(symbol))
+            else:
+                # label defined further down, or a variable
+                fixups.append((len(words), symbol))
+                words.append(0)
+        else:
+            words.append(code.encode(instruction.dest, instruction.comp, instruction.jump))
+
+    # variables get RAM addresses in order of first use, as in the two-pass path
+    ram_address = 16
+    for index, symbol in fixups:
+        if not symbol_table.contains(symbol):
+            symbol_table.add_entry(symbol, ram_address)
+            ram_address += 1
+        words[index] = symbol_table.get_address(symbol)
+
+    write_output(input_file, words, binary)
+    if source_map:
+        write_source_map(input_file, binary)
+
+def assemble_file_streaming(input_file, binary=False, source_map=False):
+    """ Assembles in two passes over the file without holding it in memory:
+    the first builds the label table, the second re-reads the source and
+    writes the output in chunks. Peak memory grows with symbols, not lines. """
+
+    symbol_table = SymbolTable()
+    rom_address = 0
+    for instruction in Parser.stream(input_file):
+        if instruction.kind == L_COMMAND:
+            symbol_table.add_entry(instruction.symbol, rom_address)
+        else:
+            rom_address += 1
+
+    code = Code()
+    ram_address = 16
+    words = []
+
+    with open(output_path(input_file, binary), 'wb' if binary else 'w') as out:
+        for instruction in Parser.stream(input_file):
+            kind = instruction.kind
 
-            if cmd_type == "A_COMMAND":
-                symbol = parser.symbol()
+            if kind == A_COMMAND:
+                symbol = instruction.symbol
                 if symbol.isdigit():
                     address = int(symbol)
                 else:
@@ -41,27 +201,96 @@ def assemble_file(input_file):
                         symbol_table.add_entry(symbol, ram_address)
                         ram_address += 1
                     address = symbol_table.get_address(symbol)
-                binary = format(address, '016b')
-                out.write(binary + '\n')
+                words.append(address)
+
+            elif kind == C_COMMAND:
+                words.append(code.encode(instruction.dest, instruction.comp, instruction.jump))
+
+            if len(words) >= STREAM_CHUNK:
+                _flush(out, words, binary)
+                words = []
 
-            elif cmd_type == "C_COMMAND":
-                dest = code.dest(parser.dest())
-                comp = code.comp(parser.comp())
-                jump = code.jump(parser.jump())
-                binary = '111' + comp + dest + jump
-                out.write(binary + '\n')
+        _flush(out, words, binary)
+
+    if source_map:
+        write_source_map(input_file, binary)
+
+def _flush(out, words, binary):
+    if binary:
+        pack_hackbin(words).tofile(out)
+    else:
+        out.write(format_hack(words))
+
+MODES = {
+    "two-pass": assemble_file,
+    "single-pass": assemble_file_single_pass,
+    "stream": assemble_file_streaming,
+}
+
+def parse_args(argv):
+    """ Returns (source, options) or None if argv is malformed """
+
+    options = {"mode": "two-pass", "binary": False, "jobs": 1, "source_map": False,
+               "cache": False, "cache_dir": CACHE_DIR, "cache_size": CACHE_SIZE}
+    sources = []
+    args = iter(argv)
+    for arg in args:
+        name, eq, value = arg.partition("=")
+        if arg in ("--single-pass", "--stream"):
+            if options["mode"] != "two-pass":
+                return None
+            options["mode"] = arg[2:]
+        elif arg == "--binary":
+            options["binary"] = True
+        elif arg == "--source-map":
+            options["source_map"] = True
+        elif arg == "--cache":
+            options["cache"] = True
+        elif name in ("--jobs", "--cache-dir", "--cache-size"):
+            if not eq:
+                value = next(args, "")
+            if name == "--cache-dir" and value:
+                options["cache"] = True
+                options["cache_dir"] = value
+            elif name == "--jobs" and value.isdigit():
+                options["jobs"] = int(value) or os.cpu_count() or 1
+            elif name == "--cache-size" and value.isdigit():
+                options["cache_size"] = int(value) * 1024 * 1024
+            else:
+                return None
+        elif arg.startswith("--"):
+            return None
+        else:
+            sources.append(arg)
+
+    if len(sources) != 1:
+        return None
+    return sources[0], options
 
 def assemble(argv):
-    if len(argv) == 1:
-        src = argv[0]
+    parsed = parse_args(argv)
+
+    if parsed:
+        src, options = parsed
+        cache = None
+        if options["cache"]:
+            cache = Cache(options["cache_dir"], VERSION, options["cache_size"])
+
         if os.path.isdir(src):
-            assemble_dir(src)
+            failed = assemble_dir(src, options["mode"], options["binary"],
+                                  options["jobs"], cache, options["source_map"])
         elif src.endswith(".asm"):
-            assemble_file(src)
+            failed = assemble_files([src], options["mode"], options["binary"],
+                                    options["jobs"], cache, options["source_map"])
+        else:
+            failed = 0
+        if failed:
+            sys.exit(1)
 
     else:
-        print("Usage: Assembler.py <filename>.asm | <directory>")
+        print("Usage: Assembler.py [--single-pass | --stream] [--binary] [--source-map] [--jobs N] "
+              "[--cache] [--cache-dir DIR] [--cache-size MB] <filename>.asm | <directory>")
         sys.exit(1)
 
 if __name__ == "__main__":
-    assemble(sys.argv[1:])
\ No newline at end of file
+    assemble(sys.argv[1:])
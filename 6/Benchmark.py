@@ -0,0 +1,197 @@
+import glob
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import Assembler
+from CPUEmulator import CPU, JITCPU, ROM_SIZE, load_rom, np
+
+def synthesize(source, copies, output_file):
+    """ Tiles an .asm program `copies` times, renaming labels per copy so
+    every copy stays a valid, independent program body. """
+
+    with open(source, 'r') as f:
+        lines = [line.split('//')[0].strip() for line in f]
+    lines = [line for line in lines if line]
+    labels = {line[1:-1] for line in lines if line.startswith('(')}
+
+    with open(output_file, 'w') as out:
+        for k in range(copies):
+            suffix = '$' + str(k)
+            for line in lines:
+                if line.startswith('(') and line[1:-1] in labels:
+                    line = '(' + line[1:-1] + suffix + ')'
+                elif line.startswith('@') and line[1:] in labels:
+                    line = line + suffix
+                out.write(line + '\n')
+
+    return len(lines) * copies
+
+def rom_copies(source, copies):
+    """ Returns how many of `copies` copies of source fit in ROM, since
+    the binary format has no room for addresses past 16 bits """
+
+    with open(source, 'r') as f:
+        lines = [line.split('//')[0].strip() for line in f]
+    instructions = sum(1 for line in lines if line and not line.startswith('('))
+    return min(copies, ROM_SIZE // max(instructions, 1))
+
+def measure(assemble, input_file, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        assemble(input_file)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def measure_memory(mode, input_file):
+    """ Runs one assembly mode in a fresh interpreter and returns its
+    (seconds, peak resident set size in bytes) """
+
+    child = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, input_file],
+        check=True, capture_output=True, text=True)
+    elapsed, max_rss = child.stdout.split()
+    return float(elapsed), int(max_rss)
+
+def child(mode, input_file):
+    start = time.perf_counter()
+    Assembler.MODES[mode](input_file)
+    elapsed = time.perf_counter() - start
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        max_rss *= 1024 # kilobytes on Linux
+    print(elapsed, max_rss)
+
+def benchmark_cpu(hack_file, cycles):
+    start = time.perf_counter()
+    cpu = CPU()
+    cpu.load(hack_file)
+    loaded = time.perf_counter()
+    cpu.run(cycles)
+    elapsed = time.perf_counter() - loaded
+
+    print(f"{os.path.basename(hack_file)}: {len(cpu.rom)} words loaded and decoded in "
+          f"{loaded - start:.3f}s ({'numpy' if np is not None else 'pure Python'})")
+    print(f"{cycles:,} cycles in {elapsed:.3f}s  {cycles / elapsed:,.0f} instructions/s")
+
+def build_hack(vm_dir, tmp):
+    """ Translates a directory of .vm files with the VM translator from
+    project 8 and assembles it, returning the .hack path """
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    translator = os.path.join(here, "..", "7, 8", "VMTranslator.py")
+    name = os.path.basename(os.path.normpath(vm_dir))
+    work_dir = os.path.join(tmp, name)
+    shutil.copytree(vm_dir, work_dir)
+    subprocess.run([sys.executable, translator, work_dir], check=True)
+    asm_file = os.path.join(work_dir, name + ".asm")
+    Assembler.assemble_file(asm_file)
+    return os.path.splitext(asm_file)[0] + ".hack"
+
+def benchmark_jit(cycles, programs):
+    """ programs are .hack files or directories of .vm files """
+
+    print(f"{cycles:,} cycles per program")
+    with tempfile.TemporaryDirectory() as tmp:
+        for program in programs:
+            if program.endswith(".hack"):
+                hack_file = program
+            else:
+                hack_file = build_hack(program, tmp)
+            name = os.path.basename(os.path.normpath(program))
+            words = len(load_rom(hack_file))
+            if words > ROM_SIZE:
+                print(f"{name:>12}: {words} words, does not fit in ROM")
+                continue
+            timings = []
+            cpus = []
+            for tier in (CPU, JITCPU):
+                cpu = tier()
+                cpu.load(hack_file)
+                start = time.perf_counter()
+                cpu.run(cycles)
+                timings.append(time.perf_counter() - start)
+                cpus.append(cpu)
+
+            interpreter, jit = cpus
+            same = (interpreter.ram, interpreter.pc) == (jit.ram, jit.pc)
+            print(f"{name:>12}: "
+                  f"interpreter {cycles / timings[0]:,.0f}/s  jit {cycles / timings[1]:,.0f}/s  "
+                  f"speedup {timings[0] / timings[1]:.2f}x  {len(jit.blocks)} blocks"
+                  f"{'' if same else '  STATE MISMATCH'}")
+
+def main(argv):
+    if argv[:1] == ["--child"]:
+        child(argv[1], argv[2])
+        return
+
+    if argv[:1] == ["--jit"]:
+        here = os.path.dirname(os.path.abspath(__file__))
+        cycles = int(argv[1]) if len(argv) >= 2 else 5000000
+        programs = argv[2:] or [os.path.join(here, "pong", "Pong.hack")] + sorted(
+            d for d in glob.glob(os.path.join(here, "..", "12", "*Test"))
+            if os.path.exists(os.path.join(d, "Sys.vm")))
+        benchmark_jit(cycles, programs)
+        return
+
+    if argv[:1] == ["--cpu"]:
+        here = os.path.dirname(os.path.abspath(__file__))
+        cycles = int(argv[1]) if len(argv) >= 2 else 5000000
+        hack_file = argv[2] if len(argv) >= 3 else os.path.join(here, "pong", "Pong.hack")
+        benchmark_cpu(hack_file, cycles)
+        return
+
+    memory = argv[:1] == ["--memory"]
+    if memory:
+        argv = argv[1:]
+
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pong", "Pong.asm")
+    copies = 100 if memory else 4
+    repeat = 3
+    if len(argv) >= 1:
+        source = argv[0]
+    if len(argv) >= 2:
+        copies = int(argv[1])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = os.path.join(tmp, "Bench.asm")
+        num_lines = synthesize(source, copies, input_file)
+
+        if memory:
+            print(f"{num_lines} lines ({os.path.basename(source)} x {copies}), peak memory")
+            for mode in Assembler.MODES:
+                elapsed, max_rss = measure_memory(mode, input_file)
+                print(f"{mode:>12}: {elapsed:.3f}s  {max_rss / 2**20:,.1f} MiB")
+            return
+
+        print(f"{num_lines} lines ({os.path.basename(source)} x {copies}), best of {repeat}")
+        modes = [
+            ("two-pass", Assembler.assemble_file),
+            ("single-pass", Assembler.assemble_file_single_pass),
+            ("stream", Assembler.assemble_file_streaming),
+        ]
+        for name, assemble in modes:
+            elapsed = measure(assemble, input_file, repeat)
+            print(f"{name:>12}: {elapsed:.3f}s  {num_lines / elapsed:,.0f} lines/s")
+
+        # the binary run gets its own input, as many copies as fit in ROM
+        binary_copies = rom_copies(source, copies)
+        if binary_copies == 0:
+            print(f"{'binary':>12}: n/a, {os.path.basename(source)} does not fit in ROM")
+            return
+        binary_file = os.path.join(tmp, "BenchBinary.asm")
+        binary_lines = synthesize(source, binary_copies, binary_file)
+        for name, binary in (("hack", False), ("hackbin", True)):
+            elapsed = measure(lambda f: Assembler.assemble_file_single_pass(f, binary=binary),
+                              binary_file, repeat)
+            print(f"{name:>12}: {elapsed:.3f}s  {binary_lines / elapsed:,.0f} lines/s"
+                  f"  ({binary_lines} lines, x {binary_copies})")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
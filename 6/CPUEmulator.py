@@ -0,0 +1,286 @@
+import sys
+from array import array
+from Code import Code
+
+try:
+    import numpy as np
+except ImportError: # decoding falls back to plain Python
+    np = None
+
+ROM_SIZE = 32768
+RAM_SIZE = 32768
+
+# comp bits (a-bit included) -> Python expression over the unsigned registers
+COMP_EXPRESSIONS = {
+    bits: mnemonic.replace('!', '~') for mnemonic, bits in Code.comp_table.items()
+}
+
+def load_rom(path):
+    """ Reads a .hack (text) or .hackbin (packed) file into an array of words """
+
+    rom = array('H')
+    if path.endswith(".hackbin"):
+        with open(path, 'rb') as f:
+            rom.frombytes(f.read())
+        if sys.byteorder == 'big':
+            rom.byteswap()
+    else:
+        with open(path, 'r') as f:
+            rom.extend(int(line, 2) for line in f if line.strip())
+    return rom
+
+def comp_function(bits):
+    """ Returns f(D, A, M) computing the comp field on unsigned 16-bit values """
+
+    expression = COMP_EXPRESSIONS.get(bits)
+    if expression is not None:
+        return eval(f"lambda D, A, M: ({expression}) & 0xFFFF")
+    return _alu(bits)
+
+def _alu(bits):
+    # comp bits outside the standard table: evaluate the ALU control bits
+    zx, nx, zy, ny, f, no = [(bits >> shift) & 1 for shift in range(5, -1, -1)]
+    uses_m = bits >> 6
+
+    def compute(D, A, M):
+        x, y = D, M if uses_m else A
+        if zx: x = 0
+        if nx: x = ~x & 0xFFFF
+        if zy: y = 0
+        if ny: y = ~y & 0xFFFF
+        out = (x + y) & 0xFFFF if f else x & y
+        return ~out & 0xFFFF if no else out
+    return compute
+
+def decode_word(word):
+    """ An A-instruction decodes to its value, a C-instruction to a tuple
+    (comp function, reads M, dest bits, jump bits) """
+
+    if word < 0x8000:
+        return word
+    comp = (word >> 6) & 0x7F
+    return (comp_function(comp), bool(comp & 0x40), (word >> 3) & 7, word & 7)
+
+def decode(rom):
+    """ Decodes every ROM word once. Each distinct word is decoded a single
+    time; with NumPy the distinct words are found vectorized over the ROM. """
+
+    if np is not None:
+        words = np.asarray(rom, dtype=np.uint16)
+        unique, inverse = np.unique(words, return_inverse=True)
+        decoded = [decode_word(int(word)) for word in unique]
+        return [decoded[i] for i in inverse.tolist()]
+
+    cache = {}
+    program = []
+    for word in rom:
+        entry = cache.get(word)
+        if entry is None:
+            entry = cache[word] = decode_word(word)
+        program.append(entry)
+    return program
+
+def to_signed(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+class CPU:
+    """ Executes Hack machine code. Registers and RAM hold unsigned 16-bit
+    values; peek() returns them signed, as the hardware tools display them. """
+
+    def __init__(self, rom=None):
+        self.ram = [0] * RAM_SIZE
+        self.program = [0] * ROM_SIZE
+        self.A = 0
+        self.D = 0
+        self.pc = 0
+        self.cycles = 0
+        if rom is not None:
+            self.load_rom(rom)
+
+    def load(self, path):
+        self.load_rom(load_rom(path))
+
+    def load_rom(self, rom):
+        if len(rom) > ROM_SIZE:
+            raise ValueError(f"Program has {len(rom)} words, ROM holds {ROM_SIZE}")
+        self.rom = array('H', rom)
+        # the rest of ROM holds zeros, which decode to @0
+        self.program = decode(self.rom) + [0] * (ROM_SIZE - len(self.rom))
+        self.reset()
+
+    def reset(self):
+        self.A = 0
+        self.D = 0
+        self.pc = 0
+        self.cycles = 0
+
+    def peek(self, address):
+        return to_signed(self.ram[address])
+
+    def poke(self, address, value):
+        self.ram[address] = value & 0xFFFF
+
+    def run(self, cycles):
+        """ Executes `cycles` instructions """
+
+        program = self.program
+        ram = self.ram
+        A, D, pc = self.A, self.D, self.pc
+
+        for _ in range(cycles):
+            entry = program[pc]
+            if entry.__class__ is int:
+                A = entry
+                pc += 1
+                continue
+
+            comp, reads_m, dest, jump = entry
+            out = comp(D, A, ram[A] if reads_m else 0)
+            target = A
+            if dest:
+                if dest & 1: ram[A] = out
+                if dest & 4: A = out
+                if dest & 2: D = out
+            # jump bits: 4 if out < 0, 2 if out == 0, 1 if out > 0
+            if jump and jump & (2 if out == 0 else 4 if out & 0x8000 else 1):
+                pc = target & 0x7FFF
+            else:
+                pc += 1
+
+        self.A, self.D, self.pc = A, D, pc
+        self.cycles += cycles
+
+# jump bits -> condition on the unsigned ALU output
+JUMP_CONDITIONS = {
+    1: "0 < out < 0x8000", 2: "out == 0", 3: "out < 0x8000",
+    4: "out >= 0x8000", 5: "out != 0", 6: "out == 0 or out >= 0x8000",
+}
+
+MAX_BLOCK = 64 # instructions per compiled block
+
+class JITCPU(CPU):
+    """ Compiles straight-line runs of ROM, from an entry address up to and
+    including the next jump, into Python functions cached by address. A block
+    that jumps back to its own start runs as a loop inside its function for
+    as long as the cycle budget allows. Instructions the compiler does not
+    handle (non-standard comp bits), and the last few cycles of a run that a
+    whole block would overshoot, are executed by the interpreter. """
+
+    def load_rom(self, rom):
+        self.blocks = {} # ROM was replaced, compiled code is stale
+        super().load_rom(rom)
+
+    def run(self, cycles):
+        blocks = self.blocks
+        ram = self.ram
+        A, D, pc = self.A, self.D, self.pc
+        remaining = cycles
+
+        while remaining > 0:
+            block = blocks.get(pc)
+            if block is None:
+                block = blocks[pc] = self.compile_block(pc)
+            function, length = block
+
+            if function is None or length > remaining:
+                self.A, self.D, self.pc = A, D, pc
+                step = remaining if function is not None else 1
+                CPU.run(self, step)
+                self.cycles -= step
+                A, D, pc = self.A, self.D, self.pc
+                remaining -= step
+                continue
+
+            A, D, pc, executed = function(ram, A, D, remaining)
+            remaining -= executed
+
+        self.A, self.D, self.pc = A, D, pc
+        self.cycles += cycles
+
+    def compile_block(self, start):
+        """ Returns (function, length), or (None, 0) if the instruction at
+        start must be interpreted. function(ram, A, D, budget) returns the
+        new (A, D, pc, cycles executed). """
+
+        source = self.block_source(start)
+        if source is None:
+            return None, 0
+        lines, length = source
+        code = "def block(ram, A, D, budget):\n" + "".join(f"    {line}\n" for line in lines)
+        namespace = {}
+        exec(compile(code, f"<block {start}>", "exec"), namespace)
+        return namespace["block"], length
+
+    def block_source(self, start):
+        body = []
+        pc = start
+        a_value = None # A's value when known at compile time
+        condition = None # jump condition ending the block, if any
+        target = None
+
+        while pc < ROM_SIZE and pc - start < MAX_BLOCK:
+            entry = self.program[pc]
+            if entry.__class__ is int:
+                body.append(f"A = {entry}")
+                a_value = entry
+                pc += 1
+                continue
+
+            word = self.rom[pc] if pc < len(self.rom) else 0
+            expression = COMP_EXPRESSIONS.get((word >> 6) & 0x7F)
+            if expression is None:
+                break
+            _, _, dest, jump = entry
+            a_ref = "A" if a_value is None else str(a_value)
+            expression = _masked(expression.replace('M', f"ram[{a_ref}]"))
+            pc += 1
+
+            if jump or dest not in (1, 2, 4):
+                body.append(f"out = {expression}")
+                expression = "out"
+            if jump:
+                condition = JUMP_CONDITIONS.get(jump, "True")
+                target = f"{a_ref} & 0x7FFF" if a_value is None else str(a_value & 0x7FFF)
+                if dest & 4 and a_value is None:
+                    body.append(f"target = {target}")
+                    target = "target"
+            if dest & 1:
+                body.append(f"ram[{a_ref}] = {expression}")
+            if dest & 4:
+                body.append(f"A = {expression}")
+                a_value = None
+            if dest & 2:
+                body.append(f"D = {expression}")
+            if jump:
+                break
+
+        length = pc - start
+        if length == 0:
+            return None
+
+        if target == str(start):
+            # a loop: iterate here while the budget allows another round
+            lines = ["n = 0", "while True:"]
+            lines += ["    " + line for line in body]
+            lines.append(f"    n += {length}")
+            if condition == "True":
+                lines.append(f"    if n + {length} > budget: return A, D, {start}, n")
+            else:
+                lines.append(f"    if not ({condition}): return A, D, {pc}, n")
+                lines.append(f"    if n + {length} > budget: return A, D, {start}, n")
+            return lines, length
+
+        lines = body
+        if condition == "True":
+            lines.append(f"return A, D, {target}, {length}")
+        else:
+            if condition:
+                lines.append(f"if {condition}: return A, D, {target}, {length}")
+            lines.append(f"return A, D, {pc}, {length}")
+        return lines, length
+
+def _masked(expression):
+    # only arithmetic and negation can leave the 16-bit range
+    if any(op in expression for op in '+-~'):
+        return f"({expression}) & 0xFFFF"
+    return expression
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import time
+
+class Store:
+    """ Persistent content store: blobs in a directory, named by their key,
+    with an index of their sizes, build times and last use. Entries are
+    evicted least-recently-used first once the total size exceeds max_size.
+    Subclasses decide what goes into a key and what a blob holds. """
+
+    INDEX = "index.json"
+
+    def __init__(self, directory, version, max_size):
+        self.directory = directory
+        self.version = version
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(os.path.join(directory, self.INDEX), 'r') as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def digest(self, input_file, options=""):
+        """ SHA-256 of the version, options and contents of input_file """
+
+        digest = hashlib.sha256()
+        digest.update(f"{self.version}\0{options}\0".encode())
+        with open(input_file, 'rb') as f:
+            digest.update(f.read())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """ Returns the bytes stored under key, or None on a miss """
+
+        entry = self.index.get(key)
+        data = self._read(key) if entry else None
+        if data is None:
+            self.misses += 1
+            return None
+        entry["used"] = time.time()
+        self.hits += 1
+        self.time_saved += entry["seconds"]
+        return data
+
+    def put(self, key, data, seconds):
+        """ Stores data under key; seconds is what building it took """
+
+        self._write(os.path.join(self.directory, key), data)
+        self.index[key] = {"size": len(data), "seconds": seconds, "used": time.time()}
+
+    def save(self):
+        self._evict()
+        self._write(os.path.join(self.directory, self.INDEX), json.dumps(self.index).encode())
+
+    def stats(self):
+        return f"cache: hits {self.hits}, misses {self.misses}, saved {self.time_saved:.3f}s"
+
+    def _evict(self):
+        total = sum(entry["size"] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda k: self.index[k]["used"]):
+            if total <= self.max_size:
+                break
+            total -= self.index.pop(key)["size"]
+            try:
+                os.remove(os.path.join(self.directory, key))
+            except OSError:
+                pass
+
+    def _read(self, key):
+        try:
+            with open(os.path.join(self.directory, key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, path, data):
+        # write then rename so a concurrent run never sees a partial file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+class Cache(Store):
+    """ Build outputs that depend on one input file alone, keyed on the
+    SHA-256 of the input, the options that change the output (the output
+    format here) and the tool version """
+
+    def __init__(self, directory, version, max_size):
+        super().__init__(directory, version, max_size)
+        self.pending = {}
+
+    def key(self, input_file, options=""):
+        return self.digest(input_file, options)
+
+    def restore(self, input_file, output_file, options=""):
+        """ Brings output_file up to date from the cache; returns False on a miss """
+
+        key = self.key(input_file, options)
+        data = self.get(key)
+        if data is None:
+            self.pending[input_file] = key
+            return False
+
+        try:
+            with open(output_file, 'rb') as f:
+                up_to_date = f.read() == data
+        except OSError:
+            up_to_date = False
+        if not up_to_date:
+            self._write(output_file, data)
+        return True
+
+    def store(self, input_file, output_file, seconds):
+        key = self.pending.pop(input_file, None)
+        if key is None:
+            return
+        with open(output_file, 'rb') as f:
+            data = f.read()
+        self.put(key, data, seconds)
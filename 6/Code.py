@@ -1,32 +1,43 @@
 class Code:
+    """ Encodes C-command mnemonics into their bit fields as ints, already
+    shifted into place so a word is built by OR-ing the three fields. """
+
+    C_PREFIX = 0b111 << 13
+
     dest_table = {
-        'null': '000', 'M': '001', 'D': '010', 'MD': '011',
-        'A': '100', 'AM': '101', 'AD': '110', 'AMD': '111'
+        'null': 0b000, 'M': 0b001, 'D': 0b010, 'MD': 0b011,
+        'A': 0b100, 'AM': 0b101, 'AD': 0b110, 'AMD': 0b111
     }
 
     comp_table = {
-        '0': '0101010', '1': '0111111', '-1': '0111010',
-        'D': '0001100', 'A': '0110000', '!D': '0001101',
-        '!A': '0110001', '-D': '0001111', '-A': '0110011',
-        'D+1': '0011111', 'A+1': '0110111', 'D-1': '0001110',
-        'A-1': '0110010', 'D+A': '0000010', 'D-A': '0010011',
-        'A-D': '0000111', 'D&A': '0000000', 'D|A': '0010101',
-        'M': '1110000', '!M': '1110001', '-M': '1110011',
-        'M+1': '1110111', 'M-1': '1110010', 'D+M': '1000010',
-        'D-M': '1010011', 'M-D': '1000111', 'D&M': '1000000',
-        'D|M': '1010101'
+        '0': 0b0101010, '1': 0b0111111, '-1': 0b0111010,
+        'D': 0b0001100, 'A': 0b0110000, '!D': 0b0001101,
+        '!A': 0b0110001, '-D': 0b0001111, '-A': 0b0110011,
+        'D+1': 0b0011111, 'A+1': 0b0110111, 'D-1': 0b0001110,
+        'A-1': 0b0110010, 'D+A': 0b0000010, 'D-A': 0b0010011,
+        'A-D': 0b0000111, 'D&A': 0b0000000, 'D|A': 0b0010101,
+        'M': 0b1110000, '!M': 0b1110001, '-M': 0b1110011,
+        'M+1': 0b1110111, 'M-1': 0b1110010, 'D+M': 0b1000010,
+        'D-M': 0b1010011, 'M-D': 0b1000111, 'D&M': 0b1000000,
+        'D|M': 0b1010101
     }
 
     jump_table = {
-        'null': '000', 'JGT': '001', 'JEQ': '010', 'JGE': '011',
-        'JLT': '100', 'JNE': '101', 'JLE': '110', 'JMP': '111'
+        'null': 0b000, 'JGT': 0b001, 'JEQ': 0b010, 'JGE': 0b011,
+        'JLT': 0b100, 'JNE': 0b101, 'JLE': 0b110, 'JMP': 0b111
     }
 
+    dest_bits = {mnemonic: bits << 3 for mnemonic, bits in dest_table.items()}
+    comp_bits = {mnemonic: bits << 6 for mnemonic, bits in comp_table.items()}
+
     def dest(self, mnemonic):
-        return self.dest_table[mnemonic]
+        return self.dest_bits[mnemonic]
 
     def comp(self, mnemonic):
-        return self.comp_table[mnemonic]
+        return self.comp_bits[mnemonic]
 
     def jump(self, mnemonic):
         return self.jump_table[mnemonic]
+
+    def encode(self, dest, comp, jump):
+        return self.C_PREFIX | self.comp_bits[comp] | self.dest_bits[dest] | self.jump_table[jump]
@@ -1,52 +1,84 @@
+A_COMMAND = "A_COMMAND"
+C_COMMAND = "C_COMMAND"
+L_COMMAND = "L_COMMAND"
+
+class Instruction:
+    """ A cleaned assembly line, decoded once into its fields. """
+
+    __slots__ = ('kind', 'symbol', 'dest', 'comp', 'jump')
+
+    def __init__(self, kind, symbol=None, dest=None, comp=None, jump=None):
+        self.kind = kind
+        self.symbol = symbol
+        self.dest = dest
+        self.comp = comp
+        self.jump = jump
+
+    def __repr__(self):
+        if self.kind == C_COMMAND:
+            return f"Instruction({self.kind}, {self.dest}={self.comp};{self.jump})"
+        return f"Instruction({self.kind}, {self.symbol})"
+
 class Parser:
     def __init__(self, filepath):
         with open(filepath, 'r') as f:
-            lines = f.readlines()
-        self.commands = [self.clean(line) for line in lines if self.clean(line)]
+            self.instructions = [self.decode(command) for command in map(self.clean, f) if command]
         self.current_index = -1
-        self.current_command = None
+        self.current_instruction = None
+
+    @staticmethod
+    def stream(filepath):
+        """ Yields the file's Instructions lazily, holding one line at a time """
 
-    def clean(self, line):
+        with open(filepath, 'r') as f:
+            for line in f:
+                command = Parser.clean(line)
+                if command:
+                    yield Parser.decode(command)
+
+    @staticmethod
+    def clean(line):
         return line.split('//')[0].strip() # remove comments and whitespace
 
+    @staticmethod
+    def decode(command):
+        """ Turns a cleaned, non-empty line into an Instruction """
+
+        if command[0] == '@':
+            return Instruction(A_COMMAND, command[1:])
+        if command[0] == '(':
+            return Instruction(L_COMMAND, command[1:-1])
+
+        dest, eq, comp_jump = command.partition('=')
+        if not eq:
+            dest, comp_jump = 'null', dest
+        comp, semi, jump = comp_jump.partition(';')
+        if not semi:
+            jump = 'null'
+        return Instruction(C_COMMAND, None, dest, comp, jump)
+
     def has_more_commands(self):
-        return self.current_index + 1 < len(self.commands)
+        return self.current_index + 1 < len(self.instructions)
 
     def advance(self):
         self.current_index += 1
-        self.current_command = self.commands[self.current_index]
+        self.current_instruction = self.instructions[self.current_index]
 
     def reset(self):
         self.current_index = -1
-        self.current_command = None
+        self.current_instruction = None
 
     def command_type(self):
-        if self.current_command.startswith('@'):
-            return "A_COMMAND"
-        elif self.current_command.startswith('('):
-            return "L_COMMAND"
-        else:
-            return "C_COMMAND"
+        return self.current_instruction.kind
 
     def symbol(self):
-        if self.command_type() == "A_COMMAND":
-            return self.current_command[1:]
-        elif self.command_type() == "L_COMMAND":
-            return self.current_command[1:-1]
+        return self.current_instruction.symbol
 
     def dest(self):
-        if '=' in self.current_command:
-            return self.current_command.split('=')[0]
-        return 'null'
+        return self.current_instruction.dest
 
     def comp(self):
-        parts = self.current_command.split('=')
-        comp_jump = parts[-1]
-        if ';' in comp_jump:
-            return comp_jump.split(';')[0]
-        return comp_jump
+        return self.current_instruction.comp
 
     def jump(self):
-        if ';' in self.current_command:
-            return self.current_command.split(';')[1]
-        return 'null'
\ No newline at end of file
+        return self.current_instruction.jump
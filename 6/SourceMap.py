@@ -0,0 +1,133 @@
+import os
+import sys
+from array import array
+from bisect import bisect_right
+from Parser import Parser, L_COMMAND
+
+class SourceMap:
+    """ Maps positions in a generated file (ROM addresses, or 1-based lines
+    of a .asm or .vm file) back to source lines. Positions are grouped into
+    runs with the same source: `starts` holds the first position of each
+    run in a sorted array, so a lookup is a binary search, and `sources`
+    the (file index, line) chain of each run, the nearest source first.
+
+    On disk a map is a table of `file <path>` lines, paths relative to the
+    map's directory, followed by one `<start> [<file index> <line> ...]`
+    line per run. It is written as a sidecar `<output>.map`. """
+
+    def __init__(self):
+        self.files = []
+        self.file_index = {}
+        self.starts = array('l')
+        self.sources = []
+
+    def add(self, start, chain):
+        """ Maps the positions from start on to chain, a tuple of (file,
+        line) pairs; runs must be added in order of start """
+
+        chain = tuple((self._file(name), line) for name, line in chain)
+        if self.sources and self.sources[-1] == chain:
+            return
+        if self.starts and self.starts[-1] == start:
+            self.sources[-1] = chain
+            return
+        self.starts.append(start)
+        self.sources.append(chain)
+
+    def lookup(self, position):
+        """ Returns the (file, line) chain of position, () if it has no
+        source, or None if it comes before the first run """
+
+        i = bisect_right(self.starts, position) - 1
+        if i < 0:
+            return None
+        return tuple((self.files[index], line) for index, line in self.sources[i])
+
+    def _file(self, name):
+        index = self.file_index.get(name)
+        if index is None:
+            index = self.file_index[name] = len(self.files)
+            self.files.append(name)
+        return index
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            for name in self.files:
+                f.write(f"file {name}\n")
+            for start, chain in zip(self.starts, self.sources):
+                fields = [str(start)]
+                for index, line in chain:
+                    fields += [str(index), str(line)]
+                f.write(" ".join(fields) + "\n")
+
+    @classmethod
+    def load(cls, path):
+        source_map = cls()
+        with open(path, 'r') as f:
+            for line in f:
+                if line.startswith("file "):
+                    source_map._file(line[5:].rstrip("\n"))
+                    continue
+                fields = [int(field) for field in line.split()]
+                if fields:
+                    source_map.starts.append(fields[0])
+                    source_map.sources.append(tuple(zip(fields[1::2], fields[2::2])))
+        return source_map
+
+def instruction_lines(input_file):
+    """ Yields the 1-based line of each ROM instruction in a .asm file """
+
+    with open(input_file, 'r') as f:
+        for number, line in enumerate(f, 1):
+            command = Parser.clean(line)
+            if command and Parser.decode(command).kind != L_COMMAND:
+                yield number
+
+def rom_map(input_file):
+    """ Maps the ROM addresses of an assembled .asm file to their sources.
+    When the translator wrote <input_file>.map each address goes to its
+    .vm line, followed by the .jack line when the compiler wrote a map for
+    that .vm file; otherwise it goes to its line of the .asm file. Paths
+    are relative to the .asm file's directory. """
+
+    directory = os.path.dirname(os.path.abspath(input_file))
+    asm_map = None
+    if os.path.exists(input_file + ".map"):
+        asm_map = SourceMap.load(input_file + ".map")
+    vm_maps = {}
+
+    source_map = SourceMap()
+    name = os.path.basename(input_file)
+    for address, asm_line in enumerate(instruction_lines(input_file)):
+        if asm_map is None:
+            source_map.add(address, ((name, asm_line),))
+            continue
+
+        chain = asm_map.lookup(asm_line) or ()
+        for vm_file, vm_line in chain[:1]:
+            if vm_file not in vm_maps:
+                path = os.path.join(directory, vm_file) + ".map"
+                vm_maps[vm_file] = SourceMap.load(path) if os.path.exists(path) else None
+            vm_map = vm_maps[vm_file]
+            if vm_map:
+                # the .vm map's paths are relative to the .vm file
+                vm_dir = os.path.dirname(os.path.join(directory, vm_file))
+                chain += tuple((os.path.relpath(os.path.join(vm_dir, jack_file), directory), line)
+                               for jack_file, line in vm_map.lookup(vm_line) or ())
+        source_map.add(address, chain)
+    return source_map
+
+def main():
+    args = sys.argv[1:]
+    if len(args) < 2 or not all(arg.isdigit() for arg in args[1:]):
+        print("Usage: SourceMap.py <filename>.map <address> ...")
+        sys.exit(1)
+
+    source_map = SourceMap.load(args[0])
+    for address in args[1:]:
+        chain = source_map.lookup(int(address))
+        shown = " <- ".join(f"{name}:{line}" for name, line in chain) if chain else "no source"
+        print(f"{address}: {shown}")
+
+if __name__ == "__main__":
+    main()
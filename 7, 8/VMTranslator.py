@@ -1,17 +1,220 @@
 import sys
 import os
-from vmparser import Parser
+import time
+from concurrent.futures import ProcessPoolExecutor
+from vmparser import (Parser, C_ARITHMETIC, C_PUSH, C_POP, C_LABEL, C_GOTO, C_IF,
+                      C_FUNCTION, C_RETURN, C_CALL)
 from codewriter import CodeWriter
+from fragmentcache import FragmentCache
+from analysis import report
+
+VERSION = "1.1" # bump when output changes, to invalidate cached fragments
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "vm-translator")
+CACHE_SIZE = 64 * 1024 * 1024
+
+def call_graph(vm_files):
+    """ Returns {function: set of functions it calls} """
+
+    graph = {}
+    callees = graph.setdefault("", set()) # commands before the first function
+    for vm_file in vm_files:
+        for opcode, args in Parser(vm_file):
+            if opcode == C_FUNCTION:
+                callees = graph.setdefault(args[0], set())
+            elif opcode == C_CALL:
+                callees.add(args[0])
+    return graph
+
+def reachable(graph, root):
+    """ Returns the functions reachable from root in the call graph """
+
+    seen = {root}
+    stack = [root]
+    while stack:
+        for callee in graph.get(stack.pop(), ()):
+            if callee not in seen:
+                seen.add(callee)
+                stack.append(callee)
+    return seen
+
+def translate(vm_files, output_path, optimize=False, compact=False, prune=False,
+              prologue=None, loop_threshold=None, jobs=1, cache=None, source_map=False):
+    """ Returns (functions, commands) eliminated as unreachable from
+    Sys.init when prune is set. With jobs > 1 or a cache, each file is
+    translated on its own into a fragment with file-scoped labels, in a
+    worker process or taken from the cache, and the fragments are joined
+    in file order after the bootstrap code. A source map is only written
+    by the sequential path, so source_map overrides jobs and cache. """
+
+    writer_options = (optimize, compact, prologue, loop_threshold)
+    code_writer = CodeWriter(output_path, *writer_options, source_map=source_map)
+    has_sys = any(os.path.basename(f) == "Sys.vm" for f in vm_files)
+
+    if has_sys:
+        code_writer.write_init()
+
+    keep = None
+    if prune and has_sys:
+        keep = reachable(call_graph(vm_files), "Sys.init") | {""}
+    functions = commands = 0
+
+    if not source_map and (cache or (jobs > 1 and len(vm_files) > 1)):
+        for fragment, routines, eliminated in translate_fragments(vm_files, writer_options,
+                                                                   keep, jobs, cache):
+            code_writer.write_fragment(fragment, routines)
+            functions += eliminated[0]
+            commands += eliminated[1]
+    else:
+        for vm_file in vm_files:
+            eliminated = translate_file(code_writer, vm_file, keep)
+            functions += eliminated[0]
+            commands += eliminated[1]
+
+    code_writer.close()
+    return functions, commands
+
+def translate_fragments(vm_files, writer_options, keep, jobs=1, cache=None):
+    """ Returns (fragment, routines, eliminated) per file, in file order.
+    Files whose fragment is cached are not translated again. """
+
+    results = [None] * len(vm_files)
+    keys = {}
+    if cache:
+        # the functions kept decide what a fragment holds
+        options = repr((writer_options, sorted(keep) if keep is not None else None))
+        for i, vm_file in enumerate(vm_files):
+            keys[i] = cache.key(vm_file, options)
+            results[i] = cache.get(keys[i])
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    work = [(vm_files[i], writer_options, keep) for i in missing]
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            translated = list(pool.map(_translate_job, work))
+    else:
+        translated = [_translate_job(job) for job in work]
+
+    for i, (fragment, routines, eliminated, seconds) in zip(missing, translated):
+        results[i] = (fragment, routines, eliminated)
+        if cache:
+            cache.put(keys[i], fragment, routines, eliminated, seconds)
+    if cache:
+        cache.save()
+    return results
+
+def _translate_job(job):
+    vm_file, writer_options, keep = job
+    start = time.perf_counter()
+    code_writer = CodeWriter(None, *writer_options, scoped=True)
+    eliminated = translate_file(code_writer, vm_file, keep)
+    fragment = code_writer.fragment()
+    return fragment, code_writer.routines, eliminated, time.perf_counter() - start
+
+def translate_file(code_writer, vm_file, keep=None):
+    """ Translates one file; functions not in keep (if given) are skipped.
+    Returns the (functions, commands) skipped. """
+
+    functions = commands = 0
+    parser = Parser(vm_file)
+    code_writer.set_file_name(vm_file)
+    write = handlers(code_writer)
+
+    if keep is None and not code_writer.source_map:
+        for opcode, args in parser:
+            write[opcode](*args)
+        return functions, commands
+
+    skip = False
+    for (opcode, args), line in zip(parser, parser.line_numbers):
+        if keep is not None and opcode == C_FUNCTION:
+            skip = args[0] not in keep
+            functions += skip
+        if skip:
+            commands += 1
+            continue
+        code_writer.set_line(line)
+        write[opcode](*args)
+    return functions, commands
+
+def handlers(code_writer):
+    """ Returns {opcode: CodeWriter method}; unknown commands are ignored """
+
+    return {
+        C_ARITHMETIC: code_writer.write_arithmetic,
+        C_PUSH: code_writer.write_push,
+        C_POP: code_writer.write_pop,
+        C_LABEL: code_writer.write_label,
+        C_GOTO: code_writer.write_goto,
+        C_IF: code_writer.write_if,
+        C_FUNCTION: code_writer.write_function,
+        C_RETURN: code_writer.write_return,
+        C_CALL: code_writer.write_call,
+        None: lambda command: None,
+    }
+
+FLAGS = {"--peephole": "optimize", "--compact": "compact", "--prune": "prune",
+         "--source-map": "source_map", "--analyze": "analyze"}
+
+def parse_args(argv):
+    """ Returns (source, options) or None if argv is malformed """
+
+    options = {}
+    sources = []
+    args = iter(argv)
+    for arg in args:
+        name, eq, value = arg.partition("=")
+        if name in ("--jobs", "--cache-dir", "--cache-size"):
+            if not eq:
+                value = next(args, "")
+            if name == "--cache-dir" and value:
+                options["cache_dir"] = value
+            elif name == "--jobs" and value.isdigit():
+                options["jobs"] = int(value) or os.cpu_count() or 1
+            elif name == "--cache-size" and value.isdigit():
+                options["cache_size"] = int(value) * 1024 * 1024
+            else:
+                return None
+        elif arg == "--cache":
+            options.setdefault("cache_dir", CACHE_DIR)
+        elif arg in FLAGS:
+            options[FLAGS[arg]] = True
+        elif name == "--prologue" and value in CodeWriter.LOOP_THRESHOLDS:
+            options["prologue"] = value
+        elif name == "--loop-threshold" and value.isdigit():
+            options["loop_threshold"] = int(value)
+        elif arg.startswith("--"):
+            return None
+        else:
+            sources.append(arg)
+
+    if len(sources) != 1 or ("loop_threshold" in options and "prologue" not in options):
+        return None
+    return sources[0], options
+
+def open_cache(options):
+    """ Replaces the cache settings in parsed options by a FragmentCache """
+
+    options = dict(options)
+    cache_dir = options.pop("cache_dir", None)
+    cache_size = options.pop("cache_size", CACHE_SIZE)
+    if cache_dir:
+        options["cache"] = FragmentCache(cache_dir, VERSION, cache_size)
+    return options
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: VMTranslator.py <path>")
+    parsed = parse_args(sys.argv[1:])
+    if not parsed:
+        print("Usage: VMTranslator.py [--analyze] [--jobs N] [--peephole] [--compact] [--prune] [--source-map] "
+              "[--prologue=rom|cycles [--loop-threshold=N]] "
+              "[--cache] [--cache-dir DIR] [--cache-size MB] <path>")
         sys.exit(1)
 
-    source = sys.argv[1]
+    source, options = parsed
+    options = open_cache(options)
+    analyze = options.pop("analyze", False)
 
     if os.path.isdir(source):
-        vm_files = [os.path.join(source, f) for f in os.listdir(source) if f.endswith(".vm")]
+        vm_files = sorted(os.path.join(source, f) for f in os.listdir(source) if f.endswith(".vm"))
         dir_name = os.path.basename(os.path.normpath(source))
         output_path = os.path.join(source, dir_name + ".asm")
     elif source.endswith(".vm"):
@@ -20,39 +223,13 @@ def main():
     else:
         sys.exit(1)
 
-    code_writer = CodeWriter(output_path)
-
-    if any(os.path.basename(f) == "Sys.vm" for f in vm_files):
-        code_writer.write_init()
-
-    for vm_file in vm_files:
-        parser = Parser(vm_file)
-        code_writer.set_file_name(vm_file)
-
-        while parser.has_more_commands():
-            parser.advance()
-            cmd_type = parser.command_type()
-
-            if cmd_type == "C_ARITHMETIC":
-                code_writer.write_arithmetic(parser.arg1())
-            elif cmd_type == "C_PUSH":
-                code_writer.write_push(parser.arg1(), parser.arg2())
-            elif cmd_type == "C_POP":
-                code_writer.write_pop(parser.arg1(), parser.arg2())
-            elif cmd_type == "C_LABEL":
-                code_writer.write_label(parser.arg1())
-            elif cmd_type == "C_GOTO":
-                code_writer.write_goto(parser.arg1())
-            elif cmd_type == "C_IF":
-                code_writer.write_if(parser.arg1())
-            elif cmd_type == "C_FUNCTION":
-                code_writer.write_function(parser.arg1(), parser.arg2())
-            elif cmd_type == "C_RETURN":
-                code_writer.write_return()
-            elif cmd_type == "C_CALL":
-                code_writer.write_call(parser.arg1(), parser.arg2())
-
-    code_writer.close()
+    if analyze:
+        print("\n".join(report(vm_files)))
+    functions, commands = translate(vm_files, output_path, **options)
+    if options.get("prune"):
+        print(f"eliminated {functions} unreachable functions, {commands} VM commands")
+    if options.get("cache"):
+        print(options["cache"].stats())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
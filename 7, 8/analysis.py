@@ -0,0 +1,213 @@
+import os
+from vmparser import (Parser, C_ARITHMETIC, C_PUSH, C_POP, C_LABEL, C_GOTO, C_IF,
+                      C_FUNCTION, C_RETURN, C_CALL)
+
+STACK_BASE = 256
+HEAP_BASE = 2048
+FRAME = 5 # return address, LCL, ARG, THIS, THAT
+STATIC_WORDS = 240 # RAM 16-255
+SEGMENT_WORDS = {"temp": 8, "pointer": 2}
+MAX_CONSTANT = 32767
+UNARY = {"neg", "not"}
+
+class Function:
+    """ A VM function: its commands and what the analysis found out """
+
+    def __init__(self, name, vm_file, line, n_locals):
+        self.name = name
+        self.file = vm_file
+        self.line = line
+        self.n_locals = n_locals
+        self.commands = [] # (opcode, args, line)
+        self.max_depth = 0 # operand stack words
+        self.calls = [] # (operand depth at the call, callee, number of args)
+
+def parse_functions(vm_files):
+    """ Returns {name: Function}; commands before the first function of a
+    file belong to the function "" """
+
+    functions = {}
+    for vm_file in vm_files:
+        parser = Parser(vm_file)
+        function = None
+        for (opcode, args), line in zip(parser, parser.line_numbers):
+            if opcode == C_FUNCTION:
+                function = functions[args[0]] = Function(args[0], vm_file, line, args[1])
+                continue
+            if function is None:
+                function = functions.setdefault("", Function("", vm_file, line, 0))
+            function.commands.append((opcode, args, line))
+    return functions
+
+def operand_depths(function, warn):
+    """ Follows every path through the function, setting its max operand
+    stack depth and the depth at each call. Paths that meet at a label
+    with different depths are reported. """
+
+    commands = function.commands
+    labels = {args[0]: i for i, (opcode, args, line) in enumerate(commands) if opcode == C_LABEL}
+    depths = [None] * len(commands)
+    work = [(0, 0)]
+    while work:
+        i, depth = work.pop()
+        while i < len(commands):
+            if depths[i] is not None:
+                if depths[i] != depth:
+                    warn(function, commands[i][2],
+                         f"stack depth {depth} or {depths[i]} depending on the path")
+                break
+            depths[i] = depth
+            opcode, args, line = commands[i]
+            i += 1
+
+            if opcode == C_PUSH:
+                depth += 1
+            elif opcode in (C_POP, C_IF, C_RETURN):
+                depth -= 1
+            elif opcode == C_ARITHMETIC and args[0] not in UNARY:
+                depth -= 1
+            elif opcode == C_CALL:
+                function.calls.append((depth, args[0], args[1]))
+                depth += 1 - args[1]
+            if depth < 0:
+                warn(function, line, "pops an empty stack")
+                depth = 0
+            function.max_depth = max(function.max_depth, depth)
+
+            if opcode in (C_GOTO, C_IF):
+                target = labels.get(args[0])
+                if target is None:
+                    warn(function, line, f"jumps to unknown label {args[0]}")
+                elif opcode == C_GOTO:
+                    i = target
+                else:
+                    work.append((target, depth))
+            elif opcode == C_RETURN:
+                break
+
+def check_segments(functions, warn):
+    """ Reports segment indices out of bounds. Argument counts come from
+    the call sites, so argument indices are checked against the fewest
+    arguments a function is called with. """
+
+    n_args = {}
+    for function in functions.values():
+        for depth, callee, count in function.calls:
+            n_args[callee] = min(count, n_args.get(callee, count))
+
+    statics = {}
+    for function in functions.values():
+        for opcode, args, line in function.commands:
+            if opcode not in (C_PUSH, C_POP):
+                continue
+            segment, index = args
+            if segment == "static":
+                statics[function.file] = max(statics.get(function.file, 0), index + 1)
+            elif segment == "constant" and index > MAX_CONSTANT:
+                warn(function, line, f"constant {index} does not fit in 15 bits")
+            elif segment in SEGMENT_WORDS and index >= SEGMENT_WORDS[segment]:
+                warn(function, line, f"{segment} {index} is out of bounds")
+            elif not function.name:
+                continue # code outside functions runs on segments set up by the test
+            elif segment == "local" and index >= function.n_locals:
+                warn(function, line, f"local {index} but only {function.n_locals} locals")
+            elif segment == "argument" and index >= n_args.get(function.name, index + 1):
+                warn(function, line, f"argument {index} but called with {n_args[function.name]}")
+    return sum(statics.values())
+
+def stack_usage(functions, root):
+    """ Returns ({function: worst-case stack words}, {function: frames in
+    the longest call chain}, recursive functions) for the functions
+    reachable from root. A function's words count its locals, its operand
+    stack and, at each call, the callee's frame and words. Calls back into
+    a function on the current chain are left out, so the figures of
+    recursive functions and their callers are lower bounds. """
+
+    words = {}
+    frames = {}
+    recursive = set()
+    chain = []
+
+    def visit(name):
+        if name in words:
+            return
+        if name in chain:
+            recursive.update(chain[chain.index(name):])
+            return
+        function = functions.get(name)
+        if function is None: # not in the program: nothing is known about it
+            words[name], frames[name] = 0, 1
+            return
+
+        chain.append(name)
+        peak, longest = function.max_depth, 0
+        for depth, callee, count in function.calls:
+            visit(callee)
+            peak = max(peak, depth + FRAME + words.get(callee, 0))
+            longest = max(longest, frames.get(callee, 0))
+        chain.pop()
+        words[name] = function.n_locals + peak
+        frames[name] = 1 + longest
+
+    visit(root)
+    return words, frames, recursive
+
+def unbounded(functions, recursive):
+    """ The functions that can reach a recursive one """
+
+    found = set(recursive)
+    changed = True
+    while changed:
+        changed = False
+        for function in functions.values():
+            if function.name not in found and any(callee in found for _, callee, _ in function.calls):
+                found.add(function.name)
+                changed = True
+    return found
+
+def report(vm_files):
+    """ Returns the analysis of a program as lines of text: stack words,
+    operand depth and call chain length per function reachable from
+    Sys.init (or from the code outside functions), the worst case against
+    the heap at 2048, recursion and bounds warnings """
+
+    warnings = []
+    def warn(function, line, message):
+        warnings.append(f"{os.path.basename(function.file)}:{line}: {function.name or '-'}: {message}")
+
+    functions = parse_functions(vm_files)
+    for function in functions.values():
+        operand_depths(function, warn)
+    static_words = check_segments(functions, warn)
+
+    root = "Sys.init" if "Sys.init" in functions else ""
+    if root not in functions:
+        return ["no Sys.init and no code outside functions: nothing to analyze"] + \
+               ["warning: " + warning for warning in warnings]
+    words, frames, recursive = stack_usage(functions, root)
+    lower_bound = unbounded(functions, recursive)
+
+    lines = [f"{'function':<32}{'locals':>8}{'operands':>10}{'stack':>8}{'chain':>7}"]
+    for name in sorted(words, key=lambda name: (-words[name], name)):
+        function = functions.get(name)
+        if function is None:
+            continue
+        bound = ">=" if name in lower_bound else ""
+        lines.append(f"{name or '-':<32}{function.n_locals:>8}{function.max_depth:>10}"
+                     f"{bound + str(words[name]):>8}{bound + str(frames[name]):>7}")
+
+    # the bootstrap code pushes a frame before calling Sys.init
+    top = STACK_BASE + (FRAME if root else 0) + words.get(root, 0)
+    bound = "at least " if root in lower_bound else ""
+    lines.append(f"worst case: {bound}{top - STACK_BASE} words of stack, SP up to {top}, "
+                 f"call chain of {bound}{frames.get(root, 0)} frames")
+    if top > HEAP_BASE:
+        lines.append(f"warning: the stack can overflow into the heap at {HEAP_BASE}")
+    if recursive:
+        lines.append("recursive: " + ", ".join(sorted(recursive)))
+    if static_words > STATIC_WORDS:
+        lines.append(f"warning: {static_words} static variables, only {STATIC_WORDS} fit")
+    unused = len(functions) - len([name for name in words if name in functions])
+    if unused:
+        lines.append(f"{unused} functions not reachable from {root or 'the top level'}")
+    return lines + ["warning: " + warning for warning in warnings]
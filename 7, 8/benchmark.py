@@ -0,0 +1,255 @@
+import glob
+import os
+import sys
+import tempfile
+import time
+from VMTranslator import translate, handlers, VERSION, CACHE_SIZE
+from fragmentcache import FragmentCache
+from codewriter import CodeWriter
+from vmparser import Parser as VMParser
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "6"))
+from Assembler import assemble_file
+from CPUEmulator import JITCPU, ROM_SIZE, load_rom
+from Parser import Parser, L_COMMAND
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+JUMP = 0b1110101010000111 # 0;JMP
+CYCLE_LIMIT = 20000000
+CHUNK = 4096 # cycles run between halt checks
+SYNTHETIC_COMMANDS = 1000000
+
+# translator options compared against the default output
+CONFIGS = [
+    ("default", {}),
+    ("peephole", {"optimize": True}),
+    ("compact", {"compact": True}),
+    ("both", {"optimize": True, "compact": True}),
+    ("pruned", {"prune": True}),
+    ("all", {"optimize": True, "compact": True, "prune": True}),
+    ("locals-rom", {"prologue": "rom"}),
+    ("locals-cyc", {"prologue": "cycles"}),
+]
+
+def default_programs():
+    """ The programs with a Sys.init in projects 8 and 12, and Pong
+    linked against the OS """
+
+    programs = sorted(os.path.dirname(f) for f in glob.glob(os.path.join(HERE, "*", "*", "Sys.vm")))
+    programs += sorted(os.path.dirname(f) for f in glob.glob(os.path.join(HERE, "..", "12", "*Test", "Sys.vm")))
+    programs.append(os.path.join(HERE, "..", "11", "Pong"))
+    return programs
+
+def vm_files(program):
+    files = sorted(glob.glob(os.path.join(program, "*.vm")))
+    if not any(os.path.basename(f) == "Sys.vm" for f in files):
+        # a game without the OS: link it against the OS files of a project 12 test
+        os_dir = os.path.join(HERE, "..", "12", "SysTest")
+        names = {os.path.basename(f) for f in files}
+        if "Main.vm" in names and len(files) > 1:
+            files += sorted(f for f in glob.glob(os.path.join(os_dir, "*.vm"))
+                            if os.path.basename(f) not in names)
+    return files
+
+def build(program, options, tmp):
+    """ Returns (rom, labels) for the program translated with options """
+
+    asm_file = os.path.join(tmp, os.path.basename(os.path.normpath(program)) + ".asm")
+    translate(vm_files(program), asm_file, **options)
+    assemble_file(asm_file)
+
+    labels = {}
+    address = 0
+    for instruction in Parser(asm_file).instructions:
+        if instruction.kind == L_COMMAND:
+            labels[instruction.symbol] = address
+        else:
+            address += 1
+    return load_rom(os.path.splitext(asm_file)[0] + ".hack"), labels
+
+def halt_addresses(rom, labels):
+    """ Addresses the program never leaves once it gets there: the body of
+    Sys.halt and every `@X; 0;JMP` loop at X """
+
+    halts = set()
+    for address in range(len(rom) - 1):
+        if rom[address] == address and rom[address + 1] == JUMP:
+            halts.update((address, address + 1))
+    start = labels.get("Sys.halt")
+    if start is not None:
+        ends = [a for name, a in labels.items() if '.' in name and '$' not in name and a > start]
+        halts.update(range(start, min(ends, default=len(rom))))
+    return halts
+
+def run_to_halt(rom, labels, limit):
+    """ Returns the cycles executed until the program halts or runs off
+    the end of its code, or None if it is still running after limit """
+
+    cpu = JITCPU(rom)
+    if "Sys.init" not in labels:
+        # no bootstrap code: set the segments up as the project tests do
+        for address, value in enumerate((256, 300, 400, 3000, 3010)):
+            cpu.ram[address] = value
+    halts = halt_addresses(rom, labels)
+    size = len(rom)
+
+    while cpu.cycles < limit:
+        if cpu.pc in halts or cpu.pc >= size:
+            return cpu.cycles
+        ram, state = cpu.ram[:], (cpu.A, cpu.D, cpu.pc, cpu.cycles)
+        cpu.run(CHUNK)
+        if cpu.pc in halts or cpu.pc >= size:
+            # halted somewhere in this chunk: replay it one cycle at a time
+            cpu.ram[:] = ram
+            cpu.A, cpu.D, cpu.pc, cpu.cycles = state
+            while cpu.pc not in halts and cpu.pc < size:
+                cpu.run(1)
+    return None
+
+def synthesize(commands, directory):
+    """ Writes .vm files of at least `commands` commands in all by repeating
+    the OS and test programs of project 12, one copy per file with its
+    functions renamed, so the copies differ and link into one program;
+    returns the files and the command count """
+
+    lines = []
+    for vm_file in sorted(glob.glob(os.path.join(HERE, "..", "12", "SysTest", "*.vm"))):
+        with open(vm_file, 'r') as f:
+            lines += [line.split("//")[0].strip() for line in f]
+    lines = [line for line in lines if line]
+
+    copies = -(-commands // len(lines))
+    vm_files = []
+    for k in range(copies):
+        vm_files.append(os.path.join(directory, f"Bench{k}.vm"))
+        with open(vm_files[-1], 'w') as out:
+            for line in lines:
+                command = line.split()
+                if command[0] in ("function", "call"):
+                    line = f"{command[0]} {command[1]}_{k} {command[2]}"
+                out.write(line + "\n")
+    return vm_files, len(lines) * copies
+
+def time_writer(parsed, output_file):
+    """ Times CodeWriter alone on (file, commands) parsed beforehand """
+
+    start = time.perf_counter()
+    code_writer = CodeWriter(output_file)
+    write = handlers(code_writer)
+    for vm_file, commands in parsed:
+        code_writer.set_file_name(vm_file)
+        for opcode, args in commands:
+            write[opcode](*args)
+    code_writer.close()
+    return time.perf_counter() - start
+
+def benchmark_throughput(commands, jobs):
+    with tempfile.TemporaryDirectory() as tmp:
+        vm_files, count = synthesize(commands, tmp)
+        asm_file = os.path.join(tmp, "Bench.asm")
+        print(f"{count:,} VM commands in {len(vm_files)} files, best of 3")
+        cache = FragmentCache(os.path.join(tmp, "cache"), VERSION, 1024 * CACHE_SIZE)
+        # the first of the three runs fills the cache
+        configs = CONFIGS + [(f"jobs {jobs}", {"jobs": jobs}), ("cached", {"cache": cache})]
+        for config, options in configs:
+            best = None
+            for _ in range(3):
+                start = time.perf_counter()
+                translate(vm_files, asm_file, **options)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{config:>12}: {best:.3f}s  {count / best:,.0f} commands/s")
+
+        parsed = [(vm_file, list(VMParser(vm_file))) for vm_file in vm_files]
+        best = min(time_writer(parsed, asm_file) for _ in range(3))
+        print(f"{'writer only':>12}: {best:.3f}s  {count / best:,.0f} commands/s")
+
+def benchmark_parser(copies):
+    """ Times the parser on the project 7 and 8 programs repeated `copies`
+    times: tokenizing, then reading the commands through the method API
+    and through the iterator """
+
+    lines = []
+    for vm_file in sorted(glob.glob(os.path.join(HERE, "*", "*", "*.vm"))):
+        with open(vm_file, 'r') as f:
+            lines += f.readlines()
+    with tempfile.TemporaryDirectory() as tmp:
+        vm_file = os.path.join(tmp, "Bench.vm")
+        with open(vm_file, 'w') as out:
+            out.write("".join(lines) * copies)
+
+        start = time.perf_counter()
+        parser = VMParser(vm_file)
+        tokenize = time.perf_counter() - start
+        count = len(parser.commands)
+        print(f"{count:,} VM commands")
+        print(f"{'tokenize':>12}: {tokenize:.3f}s  {count / tokenize:,.0f} commands/s")
+
+        start = time.perf_counter()
+        while parser.has_more_commands():
+            parser.advance()
+            cmd_type = parser.command_type()
+            if cmd_type in ("C_PUSH", "C_POP", "C_FUNCTION", "C_CALL"):
+                parser.arg1(), parser.arg2()
+            elif cmd_type != "C_RETURN":
+                parser.arg1()
+        elapsed = time.perf_counter() - start
+        print(f"{'methods':>12}: {elapsed:.3f}s  {count / elapsed:,.0f} commands/s")
+
+        noop = lambda *args: None
+        write = {opcode: noop for opcode in (None,) + tuple(range(9))}
+        start = time.perf_counter()
+        for opcode, args in parser:
+            write[opcode](*args)
+        elapsed = time.perf_counter() - start
+        print(f"{'iterator':>12}: {elapsed:.3f}s  {count / elapsed:,.0f} commands/s")
+
+def change(value, base):
+    if value is None or base is None:
+        return ""
+    return f"{100.0 * (value - base) / base:+.1f}%"
+
+def main():
+    args = sys.argv[1:]
+    if args[:1] == ["--throughput"]:
+        commands = int(args[1]) if len(args) >= 2 else SYNTHETIC_COMMANDS
+        jobs = int(args[2]) if len(args) >= 3 else os.cpu_count() or 1
+        benchmark_throughput(commands, jobs)
+        return
+
+    if args[:1] == ["--parser"]:
+        benchmark_parser(int(args[1]) if len(args) >= 2 else 1000)
+        return
+
+    limit = CYCLE_LIMIT
+    if args[:1] == ["--cycles"] and len(args) >= 2 and args[1].isdigit():
+        limit = int(args[1])
+        args = args[2:]
+    if any(arg.startswith("--") for arg in args):
+        print("Usage: benchmark.py [--cycles N] [<directory> ...] | --throughput [commands [jobs]] | --parser [copies]")
+        sys.exit(1)
+
+    programs = args or default_programs()
+    print(f"{'program':<22}{'config':<12}{'rom':>8}{'':>8}{'cycles':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for program in programs:
+            name = os.path.basename(os.path.normpath(program))
+            base_words = base_cycles = None
+            for config, options in CONFIGS:
+                rom, labels = build(program, options, tmp)
+                words = len(rom)
+                if words > ROM_SIZE:
+                    cycles, shown = None, "over ROM"
+                else:
+                    try:
+                        cycles = run_to_halt(rom, labels, limit)
+                        shown = f"{cycles:,}" if cycles is not None else f"> {limit:,}"
+                    except IndexError: # addressed RAM past 32K
+                        cycles, shown = None, "fault"
+                print(f"{name:<22}{config:<12}{words:>8,}{change(words, base_words):>8}"
+                      f"{shown:>14}{change(cycles, base_cycles):>8}")
+                if base_words is None:
+                    base_words, base_cycles = words, cycles
+
+if __name__ == "__main__":
+    main()
@@ -24,26 +24,123 @@ class CodeWriter:
     POINTER_ID = 3
     TEMP_ID = 5
 
-    def __init__(self, output_path):
-        self.file = open(output_path, 'w')
+    INLINE_OFFSET = 7 # largest segment index addressed by A=A+1 steps instead of via R13
+
+    # shared instruction templates; callers concatenate, never mutate them
+    PUSHD = ['@SP', 'A=M', 'M=D', '@SP', 'M=M+1']
+    POPD = ['@SP', 'AM=M-1', 'D=M']
+
+    # smallest local count given a zero-fill loop, per prologue mode: a loop
+    # is 8 words, 6n+2 cycles; filling in place is 2n+4 words and cycles
+    LOOP_THRESHOLDS = {'rom': 3, 'cycles': None}
+
+    def __init__(self, output_path, optimize=False, compact=False, prologue=None,
+                 loop_threshold=None, scoped=False, source_map=False):
+        self.file = open(output_path, 'w') if output_path else None
         self.filename = ''
         self.static_prefix = ''
         self.label_count = 0
         self.function_prefix = ''
         self.function_stack = []
+        self.function_name = '' # scope of the labels written by write_label
+        self.optimize = optimize
+        self.pending = None # last command, held back so the peephole pass can fuse it
+        self.compact = compact
+        self.routines = set() # shared routines called so far, written out on close
+        self.lines = [] # output, written to the file once on close
+        self.templates = {} # push/pop translations, valid for the current file
+        self.return_asm = self._return()
+        self.prologue = prologue
+        self.loop_threshold = loop_threshold
+        if prologue and loop_threshold is None:
+            self.loop_threshold = self.LOOP_THRESHOLDS[prologue]
+        self.frame_asm = []
+        for segment in ['local', 'argument', 'this', 'that']:
+            self.frame_asm += self._push_segment_addr(segment) # caller's frame
+        self.scoped = scoped # prefix generated labels with the file name
+        self.label_prefix = ''
+        self.source_map = source_map # write <output>.map of asm lines to VM lines
+        self.map_path = output_path + '.map' if source_map else None
+        self.map_files = [] # .vm paths, relative to the output directory
+        self.map_runs = [] # (first asm line, file index, VM line) of each run
 
     def set_file_name(self, file_path):
+        self._flush()
         self.filename = os.path.splitext(os.path.basename(file_path))[0]
         self.static_prefix = self.filename + '.'
+        self.templates.clear() # static names depend on the file
+        self.function_name = ''
+        if self.scoped:
+            self.label_prefix = self.filename + '$'
+        if self.source_map:
+            out_dir = os.path.dirname(os.path.abspath(self.map_path))
+            self.map_files.append(os.path.relpath(os.path.abspath(file_path), out_dir))
+
+    def set_line(self, line):
+        """ Attributes the code written from now on to line `line` of the
+        current .vm file. With the peephole pass a held-back command is
+        attributed to the command it is fused with. """
+
+        if not self.source_map:
+            return
+        run = (len(self.lines) + 1, len(self.map_files) - 1, line)
+        if self.map_runs and self.map_runs[-1][0] == run[0]:
+            self.map_runs[-1] = run # the previous command wrote no code
+        else:
+            self.map_runs.append(run)
 
     def _write(self, block):
-        self.file.write('\n'.join(block) + '\n')
+        self.lines += block
+
+    def _flush(self):
+        """ Emits the held-back command unchanged """
+
+        pending, self.pending = self.pending, None
+        if pending is None:
+            return
+        if pending[0] == 'push':
+            self._write(self._load_d(pending[1], pending[2]) + self._pushd())
+        else:
+            self._write(['@SP', 'A=M-1', self.SYMBOLS[pending[0]]])
+
+    def _load_d(self, segment, index):
+        """ D = value of segment[index] """
+
+        if segment == 'constant':
+            if index in {0, 1}:
+                return ['D=' + str(index)]
+            return ['@' + str(index), 'D=A']
+        if segment in {'local', 'argument', 'this', 'that'}:
+            if index == 0:
+                return [self.SYMBOLS[segment], 'A=M', 'D=M']
+            return [self.SYMBOLS[segment], 'D=M', '@' + str(index), 'A=D+A', 'D=M']
+        return [self._register(segment, index), 'D=M']
+
+    def _store_d(self, segment, index):
+        """ segment[index] = D, as (setup, store): setup runs before D is
+        loaded, store after """
+
+        if segment in {'local', 'argument', 'this', 'that'}:
+            if index == 0:
+                return [], [self.SYMBOLS[segment], 'A=M', 'M=D']
+            if index <= self.INLINE_OFFSET:
+                return [], [self.SYMBOLS[segment], 'A=M+1'] + ['A=A+1'] * (index - 1) + ['M=D']
+            setup = ['@' + str(index), 'D=A', self.SYMBOLS[segment], 'D=D+M', '@R13', 'M=D']
+            return setup, ['@R13', 'A=M', 'M=D']
+        return [], [self._register(segment, index), 'M=D']
+
+    def _register(self, segment, index):
+        if segment == 'pointer':
+            return '@R' + str(self.POINTER_ID + index)
+        if segment == 'temp':
+            return '@R' + str(self.TEMP_ID + index)
+        return '@' + self.static_prefix + str(index)
 
     def _pushd(self):
-        return ['@SP', 'A=M', 'M=D', '@SP', 'M=M+1']
+        return self.PUSHD
 
     def _popd(self):
-        return ['@SP', 'AM=M-1', 'D=M']
+        return self.POPD
 
     def _push_constant(self, value):
         if value in {0, 1}:
@@ -82,33 +179,80 @@ class CodeWriter:
         self.label_count += 1
         return self.label_count
 
+    def _scoped(self, label):
+        """ VM labels are local to their function: label becomes Function$label """
+
+        if self.function_name:
+            return self.function_name + '$' + label
+        return label
+
     def write_label(self, label):
-        self._write(['(' + label + ')'])
+        self._label(self._scoped(label))
 
     def write_goto(self, label):
+        self._goto(self._scoped(label))
+
+    def _label(self, label):
+        self._flush()
+        self._write(['(' + label + ')'])
+
+    def _goto(self, label):
+        self._flush()
         asm = ['@' + label, '0;JMP']
         self._write(asm)
 
     def write_if(self, label):
+        label = self._scoped(label)
+        if self.pending == ('not',):
+            # not + if-goto: jump unless the value was -1 (true)
+            self.pending = None
+            self._write(['@SP', 'AM=M-1', 'D=M+1', '@' + label, 'D;JNE'])
+            return
+        self._flush()
         asm = self._popd() + ['@' + label, 'D;JNE']
         self._write(asm)
 
     def write_function(self, function_name, num_locals):
         """ Commands to declare function """
 
+        self._flush()
         self.function_prefix = self.filename + '$'
         self.function_stack.append(self.function_prefix) # PUSH current function prefix
-        self.write_label(function_name)
-
-        if num_locals != 0:
-            asm = []
-            for _ in range(num_locals):
-                asm += self._push_constant(0)
-            self._write(asm)
+        self.function_name = function_name
+        self._label(function_name)
+
+        if num_locals == 0:
+            return
+        if not self.prologue:
+            self._write(self._push_constant(0) * num_locals)
+        elif self.loop_threshold is not None and num_locals >= self.loop_threshold:
+            loop = function_name + '$$locals'
+            self._write(['@' + str(num_locals), 'D=A', '(' + loop + ')',
+                         '@SP', 'AM=M+1', 'A=A-1', 'M=0', '@' + loop, 'D=D-1;JGT'])
+        elif num_locals == 1:
+            self._write(['@SP', 'AM=M+1', 'A=A-1', 'M=0'])
+        else:
+            # zero the locals in place, then bump SP past them
+            self._write(['@SP', 'A=M', 'M=0'] + ['A=A+1', 'M=0'] * (num_locals - 1)
+                        + ['D=A+1', '@SP', 'M=D'])
 
     def write_return(self):
         """ Commands to save return value and restore caller's state """
 
+        self._flush()
+        if self.compact:
+            self.routines.add('return')
+            self._write(['@$$RETURN', '0;JMP'])
+        else:
+            self._write(self.return_asm)
+
+        # POP back to previous function context
+        if self.function_stack:
+            self.function_prefix = self.function_stack.pop()
+        else:
+            self.function_prefix = ''
+
+    def _return(self):
         asm = ['@LCL', 'D=M', '@R13', 'M=D']
         asm += ['@5', 'A=D-A', 'D=M', '@R14', 'M=D']  # get return addr
         asm += self._popd() + ['@ARG', 'A=M', 'M=D'] # get return value
@@ -116,32 +260,37 @@ class CodeWriter:
         for segment in ['that', 'this', 'argument', 'local']:
             asm += ['@R13', 'AM=M-1', 'D=M', self.SYMBOLS[segment], 'M=D'] # restore segments
         asm += ['@R14', 'A=M', '0;JMP'] # jump to return addr
-
-        self._write(asm)
-
-        # POP back to previous function context
-        if self.function_stack:
-            self.function_prefix = self.function_stack.pop()
-        else:
-            self.function_prefix = ''
+        return asm
 
     def write_call(self, function_name, num_args):
         """ Commands to save caller's state and transfer control to callee """
 
+        self._flush()
         return_suffix = 'ret.' + str(self._get_label_count())
-        label = self.function_prefix + return_suffix
+        label = (self.function_prefix or self.label_prefix) + return_suffix
+
+        if self.compact:
+            # R13 = number of args, R14 = callee, D = return addr
+            if num_args in {0, 1}:
+                asm = ['@R13', 'M=' + str(num_args)]
+            else:
+                asm = ['@' + str(num_args), 'D=A', '@R13', 'M=D']
+            asm += ['@' + function_name, 'D=A', '@R14', 'M=D', '@' + label, 'D=A', '@$$CALL', '0;JMP']
+            self._write(asm)
+            self.routines.add('call')
+            self.function_stack.append(self.function_prefix)
+            self._label(label)
+            return
 
-        asm = ['@' + label, 'D=A'] + self._pushd() # push return addr
-        for segment in ['local', 'argument', 'this', 'that']:
-            asm += self._push_segment_addr(segment)
+        asm = ['@' + label, 'D=A'] + self._pushd() + self.frame_asm # push return addr, frame
 
         asm += ['@SP', 'D=M', '@' + str(num_args+5), 'D=D-A', '@ARG', 'M=D'] # reposition ARG
         asm += ['@SP', 'D=M', '@LCL', 'M=D'] # reposition LCL
 
         self._write(asm)
         self.function_stack.append(self.function_prefix) # PUSH current function prefix
-        self.write_goto(function_name)
-        self.write_label(label)
+        self._goto(function_name)
+        self._label(label)
 
     def write_init(self):
         """ Init virtual segments and start execution"""
@@ -153,24 +302,61 @@ class CodeWriter:
         self.write_call('Sys.init', 0)
 
     def write_arithmetic(self, command):
-        if command in {'add', 'sub', 'and', 'or'}:
-            asm = ['@SP', 'AM=M-1', 'D=M', 'A=A-1', self.SYMBOLS[command]]
-        elif command in {'neg', 'not'}:
+        if self.optimize:
+            pending = self.pending
+            fusable = command not in {'neg', 'not'} and not (self.compact and command in {'eq', 'gt', 'lt'})
+            if pending and pending[0] == 'push' and fusable:
+                # push x + binary op: use x from D instead of the stack
+                self.pending = None
+                self._write(self._load_d(pending[1], pending[2]) + self._binary(command, False))
+                return
+            self._flush()
+            if command == 'not':
+                self.pending = ('not',) # may fuse with a following if-goto
+                return
+
+        if command in {'neg', 'not'}:
             asm = ['@SP', 'A=M-1', self.SYMBOLS[command]]
-        elif command in {'eq', 'gt', 'lt'}:
-            jump_label = 'label' + str(self._get_label_count())
-            sym1 = '@' + jump_label
-            sym2 = '(' + jump_label + ')' # symbol for the true state
-
-            asm = ['@SP', 'AM=M-1', 'D=M', 'A=A-1', 'D=M-D',
-                   'M=-1', # set true first
-                   sym1, self.SYMBOLS[command], # to jump if true
-                   '@SP', 'A=M-1', 'M=0', # else set *SP to false
-                   sym2]
+        else:
+            asm = self._binary(command)
 
         self._write(asm)
 
+    def _binary(self, command, pop_y=True):
+        """ Binary op on the top two stack values; with pop_y=False the top
+        value is already in D and not on the stack """
+
+        asm = ['@SP', 'AM=M-1', 'D=M', 'A=A-1'] if pop_y else ['@SP', 'A=M-1']
+        if command in {'add', 'sub', 'and', 'or'}:
+            return asm + [self.SYMBOLS[command]]
+
+        if self.compact:
+            # D = return addr, the routine pops both operands
+            self.routines.add(command)
+            return_label = self.label_prefix + 'label' + str(self._get_label_count())
+            return ['@' + return_label, 'D=A', '@$$' + command.upper(), '0;JMP', '(' + return_label + ')']
+
+        jump_label = self.label_prefix + 'label' + str(self._get_label_count())
+        sym1 = '@' + jump_label
+        sym2 = '(' + jump_label + ')' # symbol for the true state
+
+        return asm + ['D=M-D',
+                      'M=-1', # set true first
+                      sym1, self.SYMBOLS[command], # to jump if true
+                      '@SP', 'A=M-1', 'M=0', # else set *SP to false
+                      sym2]
+
     def write_push(self, segment, index):
+        if self.optimize:
+            self._flush()
+            self.pending = ('push', segment, index)
+            return
+
+        asm = self.templates.get(('push', segment, index))
+        if asm is not None:
+            self._write(asm)
+            return
+
         if segment == 'constant':
             asm = self._push_constant(index)
         elif segment in {'local', 'argument', 'this', 'that'}:
@@ -183,9 +369,29 @@ class CodeWriter:
         elif segment == 'static':
             asm = self._push_register(self.static_prefix + str(index))
 
+        self.templates[('push', segment, index)] = asm
         self._write(asm)
 
     def write_pop(self, segment, index):
+        if self.optimize:
+            pending = self.pending
+            self.pending = None
+            setup, store = self._store_d(segment, index)
+            if pending and pending[0] == 'push':
+                # push x + pop y: move x to y directly
+                self._write(setup + self._load_d(pending[1], pending[2]) + store)
+                return
+            if pending:
+                self.pending = pending
+                self._flush()
+            self._write(setup + self._popd() + store)
+            return
+
+        asm = self.templates.get(('pop', segment, index))
+        if asm is not None:
+            self._write(asm)
+            return
+
         if segment in {'local','argument','this','that'}:
             asm = self._pop_segment(segment, index)
         elif segment == 'pointer':
@@ -195,7 +401,67 @@ class CodeWriter:
         elif segment == 'static':
             asm = self._pop_register(self.static_prefix + str(index))
 
+        self.templates[('pop', segment, index)] = asm
         self._write(asm)
 
+    def _routines(self):
+        """ The shared routines called by compact code, behind a halt loop
+        so that code running off the end never enters them """
+
+        asm = ['($$END)', '@$$END', '0;JMP']
+        for command in ('eq', 'gt', 'lt'):
+            if command in self.routines:
+                # R15 = return addr; jumps to $$CMP with the result on the stack
+                asm += ['($$' + command.upper() + ')', '@R15', 'M=D',
+                        '@SP', 'AM=M-1', 'D=M', 'A=A-1', 'D=M-D', 'M=-1',
+                        '@$$CMP', self.SYMBOLS[command],
+                        '@SP', 'A=M-1', 'M=0', '@$$CMP', '0;JMP']
+        if self.routines & {'eq', 'gt', 'lt'}:
+            asm += ['($$CMP)', '@R15', 'A=M', '0;JMP']
+
+        if 'call' in self.routines:
+            asm += ['($$CALL)'] + self._pushd() + self.frame_asm # push return addr, frame
+            asm += ['@SP', 'D=M', '@R13', 'D=D-M', '@5', 'D=D-A', '@ARG', 'M=D'] # reposition ARG
+            asm += ['@SP', 'D=M', '@LCL', 'M=D'] # reposition LCL
+            asm += ['@R14', 'A=M', '0;JMP']
+
+        if 'return' in self.routines:
+            asm += ['($$RETURN)'] + self._return()
+        return asm
+
+    def fragment(self):
+        """ Returns the code written so far, without the shared routines,
+        for joining into another writer's output """
+
+        self._flush()
+        return '\n'.join(self.lines)
+
+    def write_fragment(self, fragment, routines):
+        """ Appends another writer's fragment and the routines it calls """
+
+        self._flush()
+        if fragment:
+            self.lines.append(fragment)
+        self.routines |= routines
+
     def close(self):
-        self.file.close()
\ No newline at end of file
+        self._flush()
+        if self.source_map:
+            self.map_runs.append((len(self.lines) + 1, None, None)) # the shared routines
+        if self.routines:
+            self._write(self._routines())
+        if self.lines:
+            self.file.write('\n'.join(self.lines) + '\n')
+        self.file.close()
+        if self.source_map:
+            self._write_map()
+
+    def _write_map(self):
+        """ Writes the file table, then "<first asm line> <file index> <VM line>"
+        per run; a run with no source has the first line alone """
+
+        with open(self.map_path, 'w') as f:
+            for name in self.map_files:
+                f.write(f'file {name}\n')
+            for start, index, line in self.map_runs:
+                f.write(f'{start} {index} {line}\n' if line else f'{start}\n')
\ No newline at end of file
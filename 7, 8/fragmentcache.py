@@ -0,0 +1,32 @@
+import json
+import os
+import sys
+
+# appended, so that project 6 never shadows the modules of an importer
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "6"))
+from Cache import Store
+
+class FragmentCache(Store):
+    """ Per-file asm fragments, keyed on the SHA-256 of the .vm source, its
+    name, the translator options and version. Fragments are translated with
+    file-scoped labels, so a cached one can be linked at any position in a
+    program. """
+
+    def key(self, vm_file, options):
+        # statics and labels in a fragment are named after the file
+        name = os.path.splitext(os.path.basename(vm_file))[0]
+        return self.digest(vm_file, f"{options!r}\0{name}")
+
+    def get(self, key):
+        """ Returns (fragment, routines, eliminated) or None on a miss """
+
+        data = super().get(key)
+        if data is None:
+            return None
+        data = json.loads(data)
+        return data["asm"], set(data["routines"]), tuple(data["eliminated"])
+
+    def put(self, key, fragment, routines, eliminated, seconds):
+        data = json.dumps({"asm": fragment, "routines": sorted(routines),
+                           "eliminated": list(eliminated)}).encode()
+        super().put(key, data, seconds)
@@ -0,0 +1,304 @@
+import functools
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from VMTranslator import open_cache, parse_args, translate
+from vmemulator import VMEmulator
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "6"))
+from Assembler import assemble_file
+from CPUEmulator import JITCPU, to_signed
+
+TOKEN = re.compile(r'"[^"]*"|[{},;]|[^\s{},;]+')
+COMMENT = re.compile(r'/\*.*?\*/|//[^\n]*', re.DOTALL)
+STEPS = {"vmstep", "ticktock", "tock"}
+SEGMENTS = {"sp": 0, "local": 1, "argument": 2, "this": 3, "that": 4}
+
+class ScriptError(Exception):
+    pass
+
+def parse_script(text):
+    """ Returns the script as a list of commands, each a list of words,
+    with `repeat` as ["repeat", count, [commands]] """
+
+    tokens = TOKEN.findall(COMMENT.sub('', text))
+    commands, rest = _parse_block(tokens, 0)
+    if rest != len(tokens):
+        raise ScriptError("unbalanced '}'")
+    return commands
+
+def _parse_block(tokens, i):
+    commands = []
+    words = []
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        if token in (",", ";"):
+            if words:
+                commands.append(words)
+            words = []
+        elif token == "{":
+            if words[:1] != ["repeat"] or len(words) != 2:
+                raise ScriptError(f"unsupported block: {' '.join(words)}")
+            body, i = _parse_block(tokens, i)
+            commands.append(["repeat", int(words[1]), body])
+            words = []
+        elif token == "}":
+            break
+        else:
+            words.append(token)
+    if words:
+        commands.append(words)
+    return commands, i
+
+def _count_steps(commands):
+    """ Returns how many steps a block runs, or None if it does more than step """
+
+    steps = 0
+    for command in commands:
+        if command[0] == "repeat":
+            inner = _count_steps(command[2])
+            if inner is None:
+                return None
+            steps += command[1] * inner
+        elif command[0] in STEPS:
+            steps += 1
+        elif command[0] != "tick":
+            return None
+    return steps
+
+class VMMachine:
+    def __init__(self, path):
+        self.emulator = VMEmulator(path)
+
+    def step(self, count):
+        self.emulator.run(count)
+
+    def address(self, name):
+        return _address(name, self.emulator.ram)
+
+    def get(self, name):
+        return self.emulator.peek(self.address(name))
+
+    def set(self, name, value):
+        self.emulator.poke(self.address(name), value)
+
+class CPUMachine:
+    def __init__(self, hack_file):
+        self.cpu = JITCPU()
+        self.cpu.load(hack_file)
+
+    def step(self, count):
+        self.cpu.run(count)
+
+    def get(self, name):
+        if name in ("A", "D"):
+            return to_signed(getattr(self.cpu, name))
+        if name == "PC":
+            return self.cpu.pc
+        return self.cpu.peek(_address(name, self.cpu.ram))
+
+    def set(self, name, value):
+        if name in ("A", "D"):
+            setattr(self.cpu, name, value & 0xFFFF)
+        elif name == "PC":
+            self.cpu.pc = value
+        else:
+            self.cpu.poke(_address(name, self.cpu.ram), value)
+
+def _address(name, ram):
+    """ Maps RAM[i], sp, local, local[i], ..., temp[i] to a RAM address """
+
+    base, _, index = name.partition("[")
+    index = int(index.rstrip("]")) if index else None
+    if base == "RAM" and index is not None:
+        return index
+    if base == "temp" and index is not None:
+        return 5 + index
+    if base in SEGMENTS:
+        if index is None:
+            return SEGMENTS[base]
+        return ram[SEGMENTS[base]] + index
+    raise ScriptError(f"unknown variable {name}")
+
+def format_value(value, spec):
+    """ Formats a value per an output-list spec such as D1.6.1 """
+
+    kind, widths = spec[0], spec[1:]
+    left, width, right = [int(w) for w in widths.split(".")]
+    if kind == "D":
+        text = str(value)
+    elif kind == "X":
+        text = format(value & 0xFFFF, "04X")[-width:]
+    elif kind == "B":
+        text = format(value & 0xFFFF, "016b")[-width:]
+    else:
+        text = str(value)
+    return " " * left + text.rjust(width) + " " * right
+
+def format_header(name, spec):
+    left, width, right = [int(w) for w in spec[1:].split(".")]
+    total = left + width + right
+    name = name[:total]
+    pad = total - len(name)
+    return " " * (pad // 2) + name + " " * (pad - pad // 2)
+
+class TestScript:
+    """ Executes a .tst script against the local emulators and collects
+    the lines it outputs """
+
+    def __init__(self, tst_file, translate_options=None):
+        self.tst_file = tst_file
+        self.translate_options = translate_options or {}
+        self.directory = os.path.dirname(os.path.abspath(tst_file))
+        self.machine = None
+        self.output_list = []
+        self.compare_to = None
+        self.lines = []
+        self.tmp = None
+
+    def run(self):
+        with open(self.tst_file, 'r') as f:
+            commands = parse_script(f.read())
+        with tempfile.TemporaryDirectory() as self.tmp:
+            self._execute(commands)
+        return self.lines
+
+    def _execute(self, commands):
+        for command in commands:
+            name = command[0]
+            if name == "repeat":
+                steps = _count_steps(command[2])
+                if steps is not None:
+                    self.machine.step(command[1] * steps) # one call for the whole loop
+                else:
+                    for _ in range(command[1]):
+                        self._execute(command[2])
+            elif name in STEPS:
+                self.machine.step(1)
+            elif name == "load":
+                self._load(command[1] if len(command) > 1 else None)
+            elif name == "set":
+                self.machine.set(command[1], int(command[2]))
+            elif name == "output-list":
+                self.output_list = [item.split("%") for item in command[1:]]
+                self.lines.append("|" + "|".join(format_header(n, s) for n, s in self.output_list) + "|")
+            elif name == "output":
+                values = [format_value(self.machine.get(n), s) for n, s in self.output_list]
+                self.lines.append("|" + "|".join(values) + "|")
+            elif name == "compare-to":
+                self.compare_to = os.path.join(self.directory, command[1])
+            elif name in ("output-file", "echo", "clear-echo", "tick"):
+                pass
+            else:
+                raise ScriptError(f"unsupported command {name}")
+
+    def _load(self, program):
+        if program is None or program.endswith(".vm"):
+            self.machine = VMMachine(os.path.join(self.directory, program or ""))
+            return
+
+        path = os.path.join(self.directory, program)
+        if program.endswith(".asm"):
+            vm_files = sorted(os.path.join(self.directory, f)
+                              for f in os.listdir(self.directory) if f.endswith(".vm"))
+            asm_file = os.path.join(self.tmp, program)
+            if vm_files:
+                # test the current translator rather than a stale .asm
+                translate(vm_files, asm_file, **self.translate_options)
+            else:
+                with open(path, 'r') as src, open(asm_file, 'w') as dst:
+                    dst.write(src.read())
+            assemble_file(asm_file)
+            path = os.path.splitext(asm_file)[0] + ".hack"
+        self.machine = CPUMachine(path)
+
+def compare(lines, cmp_file):
+    """ Returns the first mismatch as a message, or None. A '*' in the
+    .cmp file matches any character. """
+
+    with open(cmp_file, 'r') as f:
+        expected = [line.rstrip("\r\n") for line in f if line.strip()]
+    for number, (want, got) in enumerate(zip(expected, lines), 1):
+        if len(want) != len(got) or any(w not in ("*", g) for w, g in zip(want, got)):
+            return f"line {number}: expected {want} got {got}"
+    if len(expected) != len(lines):
+        return f"expected {len(expected)} lines, got {len(lines)}"
+    return None
+
+def run_test(tst_file, translate_options=None):
+    """ Returns (tst_file, status, message, seconds) """
+
+    start = time.perf_counter()
+    try:
+        script = TestScript(tst_file, translate_options)
+        lines = script.run()
+        if script.compare_to is None:
+            status, message = "SKIP", "no compare-to"
+        else:
+            message = compare(lines, script.compare_to)
+            status = "FAIL" if message else "PASS"
+    except Exception as e:
+        status, message = "ERROR", f"{type(e).__name__}: {e}"
+    return tst_file, status, message, time.perf_counter() - start
+
+def find_tests(paths):
+    tests = []
+    for path in paths:
+        if path.endswith(".tst"):
+            tests.append(path)
+            continue
+        for root, _, files in os.walk(path):
+            tests += [os.path.join(root, f) for f in files if f.endswith(".tst")]
+    return sorted(tests)
+
+def main():
+    args = sys.argv[1:]
+    jobs = 1
+    translator_args = [] # VMTranslator options, applied to .asm tests
+    while args[:1] and args[0].startswith("--"):
+        if args[0] == "--jobs" and len(args) >= 2 and args[1].isdigit():
+            jobs = int(args[1]) or os.cpu_count() or 1
+            args = args[2:]
+        elif args[0] in ("--cache-dir", "--cache-size") and len(args) >= 2:
+            translator_args += args[:2] # the option and its value
+            args = args[2:]
+        else:
+            translator_args.append(args.pop(0))
+    parsed = parse_args(translator_args + ["."])
+    if not args or not parsed:
+        print("Usage: testrunner.py [--jobs N] [VMTranslator options] <filename>.tst | <directory> ...")
+        sys.exit(1)
+    translate_options = open_cache(parsed[1])
+    translate_options.pop("analyze", None) # the tests are run, not analyzed
+
+    tests = find_tests(args)
+    run = functools.partial(run_test, translate_options=translate_options)
+    start = time.perf_counter()
+    if jobs > 1 and len(tests) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(run, tests))
+    else:
+        results = [run(test) for test in tests]
+
+    failed = skipped = 0
+    for tst_file, status, message, seconds in results:
+        line = f"{status:5} {seconds:8.3f}s  {tst_file}"
+        if status == "SKIP":
+            skipped += 1
+        elif status != "PASS":
+            failed += 1
+        if status != "PASS":
+            line += f"  ({message})"
+        print(line)
+    passed = len(results) - failed - skipped
+    print(f"{passed}/{len(results)} passed" + (f", {skipped} skipped" if skipped else "")
+          + f" in {time.perf_counter() - start:.3f}s")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
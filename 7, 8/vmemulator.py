@@ -0,0 +1,253 @@
+import os
+import sys
+import time
+from array import array
+from vmparser import (Parser, C_ARITHMETIC, C_PUSH, C_POP, C_LABEL, C_GOTO, C_IF,
+                      C_FUNCTION, C_RETURN, C_CALL)
+
+RAM_SIZE = 32768
+SP, LCL, ARG, THIS, THAT = 0, 1, 2, 3, 4
+TEMP = 5
+STATIC = 16
+
+# opcodes of the resolved program
+(PUSH_CONSTANT, PUSH_ADDRESS, PUSH_SEGMENT, POP_ADDRESS, POP_SEGMENT,
+ ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+ GOTO, IF_GOTO, CALL, FUNCTION, RETURN) = range(19)
+
+ARITHMETIC = {
+    'add': ADD, 'sub': SUB, 'neg': NEG, 'eq': EQ, 'gt': GT, 'lt': LT,
+    'and': AND, 'or': OR, 'not': NOT
+}
+SEGMENT_POINTERS = {'local': LCL, 'argument': ARG, 'this': THIS, 'that': THAT}
+
+def wrap(value):
+    """ Wraps an int to the signed 16-bit range """
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+class VMEmulator:
+    """ Executes VM commands directly on a stack machine over a 32K-word RAM,
+    instead of translating them to Hack assembly. Commands are resolved once
+    at load time: segment accesses to fixed addresses, labels and function
+    names to program indices. The stack pointer is kept in a local while
+    running and written back to RAM[0] when run() returns. """
+
+    def __init__(self, path=None):
+        self.ram = array('h', bytes(2 * RAM_SIZE))
+        self.program = []
+        self.functions = {}
+        self.pc = 0
+        self.steps = 0
+        if path is not None:
+            self.load(path)
+
+    def load(self, path):
+        """ Loads a .vm file, or every .vm file in a directory """
+
+        if os.path.isdir(path):
+            vm_files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".vm"))
+        else:
+            vm_files = [path]
+        if not vm_files:
+            raise ValueError(f"{path}: no .vm files")
+
+        commands = []
+        statics = {}
+        for vm_file in vm_files:
+            commands += self._parse(vm_file, statics)
+        self._resolve(commands)
+
+        self.ram[SP] = 256
+        if "Sys.init" in self.functions:
+            self.pc = self.functions["Sys.init"]
+            self.ram[LCL] = self.ram[ARG] = 256
+        else:
+            self.pc = 0
+        self.steps = 0
+
+    def _parse(self, vm_file, statics):
+        """ Returns (opcode, arg1, arg2, function) tuples; label and call
+        arguments are still names at this point """
+
+        class_name = os.path.splitext(os.path.basename(vm_file))[0]
+        commands = []
+        function = ""
+
+        for opcode, args in Parser(vm_file):
+            if opcode == C_ARITHMETIC:
+                command = (ARITHMETIC[args[0]], None, None)
+            elif opcode in (C_PUSH, C_POP):
+                segment, index = args
+                push = opcode == C_PUSH
+                if segment == 'constant':
+                    command = (PUSH_CONSTANT, index, None)
+                elif segment in SEGMENT_POINTERS:
+                    command = (PUSH_SEGMENT if push else POP_SEGMENT, SEGMENT_POINTERS[segment], index)
+                else:
+                    if segment == 'static':
+                        key = class_name + '.' + str(index)
+                        address = statics.setdefault(key, STATIC + len(statics))
+                    elif segment == 'temp':
+                        address = TEMP + index
+                    elif segment == 'pointer':
+                        address = THIS + index
+                    else:
+                        raise ValueError(f"{vm_file}: unknown segment {segment}")
+                    command = (PUSH_ADDRESS if push else POP_ADDRESS, address, None)
+            elif opcode == C_LABEL:
+                commands.append(("label", function + "$" + args[0], None, function))
+                continue
+            elif opcode == C_GOTO:
+                command = (GOTO, function + "$" + args[0], None)
+            elif opcode == C_IF:
+                command = (IF_GOTO, function + "$" + args[0], None)
+            elif opcode == C_FUNCTION:
+                function, num_locals = args
+                commands.append(("function", function, None, function))
+                command = (FUNCTION, num_locals, None)
+            elif opcode == C_CALL:
+                command = (CALL, args[0], args[1])
+            elif opcode == C_RETURN:
+                command = (RETURN, None, None)
+            else:
+                raise ValueError(f"{vm_file}: cannot parse {args[0]!r}")
+
+            commands.append(command + (function,))
+        return commands
+
+    def _resolve(self, commands):
+        labels = {}
+        self.functions = {}
+        index = 0
+        for opcode, arg1, _, _ in commands:
+            if opcode == "label":
+                labels[arg1] = index
+            elif opcode == "function":
+                self.functions[arg1] = index
+            else:
+                index += 1
+
+        self.program = []
+        for opcode, arg1, arg2, function in commands:
+            if opcode in ("label", "function"):
+                continue
+            if opcode in (GOTO, IF_GOTO):
+                if arg1 not in labels:
+                    raise ValueError(f"unknown label {arg1.partition('$')[2]} in {function or 'top level'}")
+                arg1 = labels[arg1]
+            elif opcode == CALL:
+                # unknown functions fail when called, not at load time
+                arg1 = self.functions.get(arg1, arg1)
+            self.program.append((opcode, arg1, arg2))
+
+    def peek(self, address):
+        return self.ram[address]
+
+    def poke(self, address, value):
+        self.ram[address] = wrap(value)
+
+    def run(self, steps):
+        """ Executes `steps` VM commands """
+
+        program = self.program
+        ram = self.ram
+        pc = self.pc
+        sp = ram[SP]
+
+        for _ in range(steps):
+            opcode, arg1, arg2 = program[pc]
+            pc += 1
+
+            if opcode == PUSH_CONSTANT:
+                ram[sp] = arg1
+                sp += 1
+            elif opcode == PUSH_SEGMENT:
+                ram[sp] = ram[ram[arg1] + arg2]
+                sp += 1
+            elif opcode == POP_SEGMENT:
+                sp -= 1
+                ram[ram[arg1] + arg2] = ram[sp]
+            elif opcode == PUSH_ADDRESS:
+                ram[sp] = ram[arg1]
+                sp += 1
+            elif opcode == POP_ADDRESS:
+                sp -= 1
+                ram[arg1] = ram[sp]
+            elif opcode <= NOT:
+                if opcode == NEG:
+                    ram[sp - 1] = wrap(-ram[sp - 1])
+                    continue
+                if opcode == NOT:
+                    ram[sp - 1] = ~ram[sp - 1]
+                    continue
+                sp -= 1
+                y = ram[sp]
+                x = ram[sp - 1]
+                if opcode == ADD:
+                    x = wrap(x + y)
+                elif opcode == SUB:
+                    x = wrap(x - y)
+                elif opcode == EQ:
+                    x = -1 if x == y else 0
+                elif opcode == GT:
+                    x = -1 if x > y else 0
+                elif opcode == LT:
+                    x = -1 if x < y else 0
+                elif opcode == AND:
+                    x = x & y
+                else:
+                    x = x | y
+                ram[sp - 1] = x
+            elif opcode == IF_GOTO:
+                sp -= 1
+                if ram[sp]:
+                    pc = arg1
+            elif opcode == GOTO:
+                pc = arg1
+            elif opcode == CALL:
+                if arg1.__class__ is str:
+                    self.pc = pc - 1
+                    ram[SP] = sp
+                    raise RuntimeError(f"call to undefined function {arg1}")
+                ram[sp] = pc # return address: the index of the next command
+                ram[sp + 1] = ram[LCL]
+                ram[sp + 2] = ram[ARG]
+                ram[sp + 3] = ram[THIS]
+                ram[sp + 4] = ram[THAT]
+                sp += 5
+                ram[ARG] = sp - 5 - arg2
+                ram[LCL] = sp
+                pc = arg1
+            elif opcode == FUNCTION:
+                for _ in range(arg1):
+                    ram[sp] = 0
+                    sp += 1
+            else: # RETURN
+                frame = ram[LCL]
+                return_address = ram[frame - 5]
+                ram[ram[ARG]] = ram[sp - 1]
+                sp = ram[ARG] + 1
+                ram[THAT] = ram[frame - 1]
+                ram[THIS] = ram[frame - 2]
+                ram[ARG] = ram[frame - 3]
+                ram[LCL] = ram[frame - 4]
+                pc = return_address
+
+        self.pc = pc
+        ram[SP] = sp
+        self.steps += steps
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print("Usage: vmemulator.py <filename>.vm | <directory> [steps]")
+        sys.exit(1)
+
+    steps = int(sys.argv[2]) if len(sys.argv) == 3 else 1000000
+    emulator = VMEmulator(sys.argv[1])
+    start = time.perf_counter()
+    emulator.run(steps)
+    elapsed = time.perf_counter() - start
+    print(f"{steps:,} VM commands in {elapsed:.3f}s  {steps / elapsed:,.0f} commands/s")
+
+if __name__ == "__main__":
+    main()
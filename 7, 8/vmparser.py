@@ -1,19 +1,73 @@
+# opcodes of parsed commands
+(C_ARITHMETIC, C_PUSH, C_POP, C_LABEL, C_GOTO, C_IF,
+ C_FUNCTION, C_RETURN, C_CALL) = range(9)
+
+COMMAND_TYPES = ["C_ARITHMETIC", "C_PUSH", "C_POP", "C_LABEL", "C_GOTO", "C_IF",
+                 "C_FUNCTION", "C_RETURN", "C_CALL"]
+
+OPCODES = {
+    "push": C_PUSH, "pop": C_POP, "label": C_LABEL, "goto": C_GOTO, "if-goto": C_IF,
+    "function": C_FUNCTION, "return": C_RETURN, "call": C_CALL,
+    "add": C_ARITHMETIC, "sub": C_ARITHMETIC, "neg": C_ARITHMETIC,
+    "eq": C_ARITHMETIC, "gt": C_ARITHMETIC, "lt": C_ARITHMETIC,
+    "and": C_ARITHMETIC, "or": C_ARITHMETIC, "not": C_ARITHMETIC,
+}
+
 class Parser:
-    """ Parses VM commands from a file. """
+    """ Parses VM commands from a file. Each line is tokenized once into an
+    (opcode, args) tuple; iterating over the parser yields these tuples. """
 
     def __init__(self, file_path):
-        self.file = open(file_path, "r")
-        self.commands = self._clean_lines(self.file.readlines())
+        with open(file_path, "r") as f:
+            self.commands, self.line_numbers = self._clean_lines(f.readlines())
+        self.parsed = self._tokenize_all(self.commands)
         self.current_command = None
+        self.current = None
         self.index = 0
 
     def _clean_lines(self, lines):
+        """ Returns the commands and the 1-based line number of each """
+
         cleaned = []
-        for line in lines:
+        numbers = []
+        for number, line in enumerate(lines, 1):
             line = line.split("//")[0].strip()
             if line:
                 cleaned.append(line)
-        return cleaned
+                numbers.append(number)
+        return cleaned, numbers
+
+    def _tokenize_all(self, commands):
+        # most lines repeat (push constant 0, add, return, ...): tokenize each once
+        memo = {}
+        parsed = []
+        for command in commands:
+            entry = memo.get(command)
+            if entry is None:
+                entry = memo[command] = self.tokenize(command)
+            parsed.append(entry)
+        return parsed
+
+    @staticmethod
+    def tokenize(command):
+        """ Returns (opcode, args): args is (name,) for arithmetic, label,
+        goto and if-goto, (name, int) for push, pop, function and call,
+        and () for return. Unknown commands get opcode None. """
+
+        words = command.split()
+        opcode = OPCODES.get(words[0])
+        if opcode == C_ARITHMETIC:
+            return opcode, (words[0],)
+        if opcode in (C_PUSH, C_POP, C_FUNCTION, C_CALL):
+            return opcode, (words[1], int(words[2]))
+        if opcode == C_RETURN:
+            return opcode, ()
+        if opcode is None:
+            return None, (command,)
+        return opcode, (words[1],)
+
+    def __iter__(self):
+        return iter(self.parsed)
 
     def has_more_commands(self):
         return self.index < len(self.commands)
@@ -21,32 +75,15 @@ class Parser:
     def advance(self):
         if self.has_more_commands():
             self.current_command = self.commands[self.index]
+            self.current = self.parsed[self.index]
             self.index += 1
 
     def command_type(self):
-        if self.current_command.startswith("push"):
-            return "C_PUSH"
-        elif self.current_command.startswith("pop"):
-            return "C_POP"
-        elif self.current_command.split()[0] in ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]:
-            return "C_ARITHMETIC"
-        elif self.current_command.startswith("label"):
-            return "C_LABEL"
-        elif self.current_command.startswith("goto"):
-            return "C_GOTO"
-        elif self.current_command.startswith("if-goto"):
-            return "C_IF"
-        elif self.current_command.startswith("function"):
-            return "C_FUNCTION"
-        elif self.current_command.startswith("call"):
-            return "C_CALL"
-        elif self.current_command.startswith("return"):
-            return "C_RETURN"
+        opcode = self.current[0]
+        return COMMAND_TYPES[opcode] if opcode is not None else None
 
     def arg1(self):
-        if self.command_type() == "C_ARITHMETIC":
-            return self.current_command
-        return self.current_command.split()[1]
+        return self.current[1][0]
 
     def arg2(self):
-        return int(self.current_command.split()[2])
\ No newline at end of file
+        return self.current[1][1]